@@ -1,6 +1,9 @@
 import numpy as np
 from datetime import datetime
 from database import get_db
+import rollups
+import columnar_store
+from downsample import downsample_series
 
 def compute_price_trend(prices: list[float]):
     if len(prices) < 2:
@@ -69,9 +72,35 @@ def build_summary(price_trend, social_level, correlation):
 
     return "No clear pattern could be identified from the available data."
 
-async def analyze_symbol(symbol: str, td_limit: int = 30, aw_limit: int = 30):
+async def load_range(db, symbol: str, start: datetime = None, end: datetime = None):
+    """
+    Newest-first price and mention series for a date range, read from the
+    coarsest rollup that covers it.
+    """
+    resolution, td_rows = await rollups.load_price_series(db, symbol, start, end)
+    _, aw_rows = await rollups.load_mention_series(db, symbol, start, end, resolution=resolution)
+    td_prices = [row["close"] for row in reversed(td_rows) if row.get("close") is not None]
+    aw_mentions = [row["mentions"] for row in reversed(aw_rows) if row.get("mentions") is not None]
+    return resolution, td_prices, aw_mentions
+
+async def analyze_symbol(symbol: str, td_limit: int = 30, aw_limit: int = 30,
+                         start: datetime = None, end: datetime = None, max_points: int = None):
 
     db = await get_db()
+    start, end = rollups.to_naive_utc(start), rollups.to_naive_utc(end)
+
+    if start is not None or end is not None:
+        resolution, td_prices, aw_mentions = await load_range(db, symbol, start, end)
+        return build_analysis(symbol, td_prices, aw_mentions, resolution, max_points)
+
+    cached_prices = await columnar_store.load_fresh(db, symbol, "prices")
+    cached_mentions = await columnar_store.load_fresh(db, symbol, "mentions")
+    if cached_prices is not None and cached_mentions is not None:
+        # Newest-first straight from the memory-mapped columns
+        td_prices = cached_prices["close"][-td_limit:][::-1].tolist()
+        aw_mentions = cached_mentions["mentions"][-aw_limit:][::-1].tolist()
+        return build_analysis(symbol, td_prices, aw_mentions, "raw", max_points)
+
     td_collection = db[f"td_prices_{symbol}"]
 
     td_records = (
@@ -106,6 +135,15 @@ async def analyze_symbol(symbol: str, td_limit: int = 30, aw_limit: int = 30):
         except (TypeError, ValueError):
             continue
 
+    return build_analysis(symbol, td_prices, aw_mentions, "raw", max_points)
+
+def build_analysis(symbol: str, td_prices: list[float], aw_mentions: list[float], resolution: str,
+                   max_points: int = None):
+    """
+    Analysis payload from newest-first price and mention series.
+    Metrics use every point; with max_points only the chart series are
+    downsampled (LTTB).
+    """
     correlation = None
     if td_prices and aw_mentions:
         min_len = min(len(td_prices), len(aw_mentions))
@@ -136,10 +174,11 @@ async def analyze_symbol(symbol: str, td_limit: int = 30, aw_limit: int = 30):
 
         "td_count": len(td_prices),
         "aw_count": len(aw_mentions),
+        "resolution": resolution,
 
-        "td_prices_series": td_prices[::-1],
-        "aw_mentions_series": aw_mentions[::-1],
+        "td_prices_series": downsample_series(td_prices[::-1], max_points),
+        "aw_mentions_series": downsample_series(aw_mentions[::-1], max_points),
 
-        "analysis_timestamp": datetime.utcnow().isoformat(),
+        "analysis_timestamp": datetime.utcnow(),
         "summary": summary
     }
@@ -1,35 +1,43 @@
-import requests
+import upstream
 from urllib.parse import urljoin
 from typing import Dict, Any, Optional
 from datetime import datetime
 
 BASE = "https://apewisdom.io/api/v1.0"
-TIMEOUT = 10
 
 async def get_top_stocks_async(page: int = 1) -> Dict[str, Any]:
 
     url = urljoin(BASE + "/", f"filter/all-stocks/page/{page}")
-    response = requests.get(url, timeout=10)
-    if response.status_code == 429:
-        raise Exception("Rate limit exceeded")
-    response.raise_for_status()
-    return response.json()
+    return await upstream.apewisdom.get_json(url)
 
-async def get_stock_async(ticker: str, max_pages: int = 5) -> Optional[Dict[str, Any]]:
+def to_record(item: Dict[str, Any]) -> Dict[str, Any]:
+    today_str = datetime.utcnow().strftime("%d/%m/%Y")
+    return {
+        "rank": item.get("rank"),
+        "ticker": item.get("ticker"),
+        "mentions": item.get("mentions"),
+        "upvotes": item.get("upvotes"),
+        "rank_24h_ago": item.get("rank_24h_ago"),
+        "mentions_24h_ago": item.get("mentions_24h_ago"),
+        "date": today_str
+    }
 
-    ticker = ticker.upper()
-    for page in range(1, max_pages + 1):
+async def get_leaderboard_async(max_pages: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Walk the leaderboard once and index it by ticker, so looking up any
+    number of symbols costs one request per page. max_pages=None walks
+    every page the API reports.
+    """
+    leaderboard = {}
+    page = 1
+    while True:
         top_page = await get_top_stocks_async(page)
         for item in top_page.get("results", []):
-            if item.get("ticker") == ticker:
-                today_str = datetime.utcnow().strftime("%d/%m/%Y")
-                return {
-                    "rank": item.get("rank"),
-                    "ticker": item.get("ticker"),
-                    "mentions": item.get("mentions"),
-                    "upvotes": item.get("upvotes"),
-                    "rank_24h_ago": item.get("rank_24h_ago"),
-                    "mentions_24h_ago": item.get("mentions_24h_ago"),
-                    "date": today_str
-                }
-    return {}
+            leaderboard.setdefault(item.get("ticker"), item)
+        last_page = top_page.get("pages", page)
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+        if page >= last_page:
+            break
+        page += 1
+    return leaderboard
@@ -1,59 +1,82 @@
+import asyncio
 import logging
 from database import get_db
+import etl_lock
+import events
+import watchlist
+import trending
+import columnar_store
+from indexes import ensure_collection_indexes
+from rollups import rollup_mentions
 import apewisdom_client
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "META", "INTC", "NVDA", "ORCL"]
+async def load_ticker(db, ticker, leaderboard):
+    item = leaderboard.get(ticker)
+    if not item:
+        logger.warning(f"No data found for {ticker}")
+        return None
 
-async def run_etl(max_pages: int = 5):
+    data = apewisdom_client.to_record(item)
+    collection_name = f"apewisdom_{ticker}"
+    data["timestamp"] = datetime.utcnow()
+    await db[collection_name].insert_one(data)
+    await ensure_collection_indexes(db, collection_name)
+    await rollup_mentions(db, ticker, since=data["timestamp"])
+    await columnar_store.mark_changed(db, ticker, "mentions")
+    await columnar_store.refresh(db, ticker, "mentions")
+    logger.info(f"Inserted data for {ticker} into collection {collection_name}")
 
-    db = await get_db()
-    all_data = {}
+    await db["apewisdom_logs"].insert_one({
+        "timestamp": datetime.now(),
+        "message": f"Inserted data for {ticker} ({len(data)} records)",
+    })
+    return data
 
-    for ticker in SYMBOLS:
-        logger.info(f"Fetching data for {ticker} from ApeWisdom...")
-        data = await apewisdom_client.get_stock_async(ticker, max_pages=max_pages)
-        if not data:
-            logger.warning(f"No data found for {ticker}")
-            continue
+async def run_etl(max_pages: int = None):
 
-        collection_name = f"apewisdom_{ticker}"
-        await db[collection_name].insert_one(data)
-        logger.info(f"Inserted data for {ticker} into collection {collection_name}")
+    db = await get_db()
+    tickers = await watchlist.get_symbols(db)
 
+    async def progress(number, total, batch, batch_results):
         await db["apewisdom_logs"].insert_one({
             "timestamp": datetime.now(),
-            "message": f"Inserted data for {ticker} ({len(data)} records)",
+            "message": f"Batch {number}/{total} done ({len(batch_results)}/{len(batch)} tickers loaded)",
         })
 
-        all_data[ticker] = data
+    async with etl_lock.lease(db, "apewisdom") as held:
+        # One pass over the whole leaderboard serves every ticker in the
+        # universe and the trending snapshot
+        logger.info(f"Fetching ApeWisdom leaderboard ({max_pages or 'all'} pages)...")
+        leaderboard = await apewisdom_client.get_leaderboard_async(max_pages=max_pages)
+        await trending.save_snapshot(db, leaderboard)
+        all_data = await watchlist.run_batched(
+            tickers,
+            lambda ticker: load_ticker(db, ticker, leaderboard),
+            progress=progress,
+            should_stop=lambda: held.lost
+        )
 
+    await events.etl_completed("apewisdom", all_data)
     return all_data
 
-async def get_last_results(limit = 100):
+async def get_last_results(limit = 100, page: int = 1, page_size: int = 50):
 
     db = await get_db()
-    results = {}
-    for ticker in SYMBOLS:
-        collection_name = f"apewisdom_{ticker}"
-        cursor = db[collection_name].find().sort("_id", -1)
-        data = await cursor.to_list(length=limit)
-        for item in data:
-            if "_id" in item:
-                item["_id"] = str(item["_id"])
-        results[ticker] = data
-    return results
+    total, tickers = await watchlist.page_symbols(page, page_size, db=db)
+
+    async def last_records(ticker):
+        cursor = db[f"apewisdom_{ticker}"].find().sort("_id", -1)
+        return await cursor.to_list(length=limit)
+
+    records = await asyncio.gather(*(last_records(ticker) for ticker in tickers))
+    results = dict(zip(tickers, records))
+    return {"total": total, "page": page, "page_size": page_size, "results": results}
 
 async def get_history(limit = 100):
 
     db = await get_db()
     cursor = db["apewisdom_logs"].find().sort("timestamp", -1)
-    history = await cursor.to_list(length=limit)
-    for entry in history:
-        if "_id" in entry:
-            entry["_id"] = str(entry["_id"])
-        if "timestamp" in entry:
-            entry["timestamp"] = entry["timestamp"].isoformat()
-    return history
+    return await cursor.to_list(length=limit)
@@ -5,7 +5,7 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi.security import OAuth2PasswordBearer
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 import schemas, database
 import logging
 
@@ -46,6 +46,16 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(dat
     """
     Async dependency to validate token and fetch user from MongoDB.
     """
+    return await user_from_token(token, db)
+
+async def get_current_user_from_query(token: str = Query(...), db = Depends(database.get_db)):
+    """
+    Same as get_current_user for clients that cannot send headers
+    (EventSource), with the token passed as ?token=...
+    """
+    return await user_from_token(token, db)
+
+async def user_from_token(token: str, db):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
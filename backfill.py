@@ -0,0 +1,271 @@
+import os
+import json
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+import database
+import etl_lock
+import rollups
+import columnar_store
+import twelvedata_client
+import upstream
+from indexes import ensure_collection_indexes
+import watchlist
+from twelvedata_etl import TWELVE_DATA_KEY, TWELVE_DATA_URL
+
+logger = logging.getLogger("backfill")
+
+# --- CONFIGURATION ---
+CHECKPOINT_COLLECTION = "td_backfill_checkpoints"
+# TwelveData returns at most 5000 bars per request
+MAX_OUTPUTSIZE = 5000
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def price_collection(symbol: str, interval: str):
+    """
+    Daily bars keep living in td_prices_{symbol}; other intervals get their
+    own collection so analyses never mix resolutions.
+    """
+    if interval == "1day":
+        return f"td_prices_{symbol}"
+    return f"td_prices_{symbol}_{interval}"
+
+
+# Bar length of the intraday TwelveData intervals; daily and coarser
+# intervals never come near MAX_OUTPUTSIZE with the default chunk length.
+INTERVAL_MINUTES = {
+    "1min": 1, "5min": 5, "15min": 15, "30min": 30, "45min": 45,
+    "1h": 60, "2h": 120, "4h": 240, "8h": 480,
+}
+
+
+def max_chunk_days(interval: str, chunk_days: int):
+    """
+    Chunk length that keeps a request under MAX_OUTPUTSIZE bars, assuming
+    round-the-clock trading (crypto, forex) so no market is under-counted.
+    """
+    minutes = INTERVAL_MINUTES.get(interval)
+    if minutes is None:
+        return chunk_days
+    bars_per_day = 24 * 60 / minutes
+    return max(1, min(chunk_days, int(MAX_OUTPUTSIZE * 0.9 / bars_per_day)))
+
+
+def chunk_ranges(start: datetime, end: datetime, chunk_days: int):
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+
+def chunk_id(symbol: str, interval: str, chunk_start: datetime, chunk_end: datetime):
+    return f"{symbol}:{interval}:{chunk_start:%Y%m%dT%H%M}:{chunk_end:%Y%m%dT%H%M}"
+
+
+class HttpFetcher:
+    """
+    Calls the TwelveData API. With `record_dir`, every response is also
+    saved so the same backfill can be replayed offline.
+    """
+
+    def __init__(self, record_dir: str = None):
+        self.record_dir = record_dir
+        if record_dir:
+            os.makedirs(record_dir, exist_ok=True)
+
+    async def fetch(self, params: dict):
+        data = await twelvedata_client.fetch_api(TWELVE_DATA_URL, params=params)
+        if self.record_dir:
+            with open(recording_path(self.record_dir, params), "w") as f:
+                json.dump(data, f)
+        return data
+
+
+class ReplayFetcher:
+    """
+    Serves responses recorded by HttpFetcher instead of calling the API.
+    """
+
+    def __init__(self, replay_dir: str):
+        self.replay_dir = replay_dir
+
+    async def fetch(self, params: dict):
+        with open(recording_path(self.replay_dir, params)) as f:
+            return json.load(f)
+
+
+def recording_path(directory: str, params: dict):
+    start = params["start_date"].replace(" ", "T").replace(":", "")
+    end = params["end_date"].replace(" ", "T").replace(":", "")
+    return os.path.join(directory, f"{params['symbol']}_{params['interval']}_{start}_{end}.json")
+
+
+async def write_bars(db, collection: str, df):
+    """
+    Upsert bars by datetime in one unordered bulk write, so overlapping
+    chunks and re-runs never duplicate a bar.
+    """
+    if df.empty:
+        return 0
+    requests = [
+        UpdateOne({"datetime": row["datetime"]}, {"$set": row}, upsert=True)
+        for row in df.to_dict(orient="records")
+    ]
+    await db[collection].bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+async def save_checkpoint(db, checkpoint_id, symbol, interval, chunk_start, chunk_end, fields: dict):
+    await db[CHECKPOINT_COLLECTION].update_one(
+        {"_id": checkpoint_id},
+        {"$set": {
+            "symbol": symbol,
+            "interval": interval,
+            "chunk_start": chunk_start,
+            "chunk_end": chunk_end,
+            "updated_at": datetime.utcnow(),
+            **fields
+        }},
+        upsert=True
+    )
+
+
+async def backfill_chunk(db, fetcher, semaphore, symbol, interval, chunk_start, chunk_end, done=frozenset()):
+    """
+    Fetch and store the bars of [chunk_start, chunk_end). A response that
+    hits MAX_OUTPUTSIZE may be cut short, so the chunk is split in halves
+    and fetched again instead of being checkpointed as done.
+    """
+    checkpoint_id = chunk_id(symbol, interval, chunk_start, chunk_end)
+    if checkpoint_id in done:
+        return 0
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "start_date": chunk_start.strftime(DATE_FORMAT),
+        "end_date": chunk_end.strftime(DATE_FORMAT),
+        "outputsize": MAX_OUTPUTSIZE,
+        "apikey": TWELVE_DATA_KEY
+    }
+
+    async with semaphore:
+        try:
+            raw_data = await fetcher.fetch(params)
+            if raw_data.get("status") == "error" and "no data" not in raw_data.get("message", "").lower():
+                raise RuntimeError(raw_data.get("message"))
+            df = twelvedata_client.normalize_twelvedata(raw_data)
+            truncated = len(df) >= MAX_OUTPUTSIZE
+            if not truncated and not df.empty:
+                # End exclusive: the boundary bar belongs to the next chunk only,
+                # so concurrent chunks never upsert the same bar
+                df = df[(df["datetime"] >= chunk_start) & (df["datetime"] < chunk_end)]
+                bars = await write_bars(db, price_collection(symbol, interval), df)
+            else:
+                bars = 0
+        except Exception as exc:
+            logger.error(f"Chunk {checkpoint_id} failed: {exc}")
+            await save_checkpoint(db, checkpoint_id, symbol, interval, chunk_start, chunk_end,
+                                  {"status": "failed", "error": str(exc)})
+            return 0
+
+    if truncated:
+        middle = chunk_start + (chunk_end - chunk_start) / 2
+        logger.warning(f"Chunk {checkpoint_id} hit {MAX_OUTPUTSIZE} bars, splitting")
+        await save_checkpoint(db, checkpoint_id, symbol, interval, chunk_start, chunk_end,
+                              {"status": "split", "error": None})
+        halves = await asyncio.gather(
+            backfill_chunk(db, fetcher, semaphore, symbol, interval, chunk_start, middle, done),
+            backfill_chunk(db, fetcher, semaphore, symbol, interval, middle, chunk_end, done),
+        )
+        return sum(halves)
+
+    await save_checkpoint(db, checkpoint_id, symbol, interval, chunk_start, chunk_end,
+                          {"status": "done", "bars": bars, "error": None})
+    logger.info(f"Chunk {checkpoint_id} done ({bars} bars)")
+    return bars
+
+
+async def run_backfill(symbols, interval, start, end, chunk_days=180, concurrency=4, fetcher=None):
+    """
+    Backfill [start, end) for every symbol. Chunks already checkpointed as
+    done are skipped, so an interrupted run resumes where it stopped.
+    """
+    db = await database.get_db()
+    fetcher = fetcher or HttpFetcher()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with etl_lock.lease(db, "twelvedata-backfill"):
+        done = {
+            doc["_id"] async for doc in db[CHECKPOINT_COLLECTION].find(
+                {"symbol": {"$in": symbols}, "interval": interval, "status": "done"}, {"_id": 1}
+            )
+        }
+        tasks = []
+        chunk_days = max_chunk_days(interval, chunk_days)
+        for symbol in symbols:
+            await ensure_collection_indexes(db, price_collection(symbol, interval))
+            for chunk_start, chunk_end in chunk_ranges(start, end, chunk_days):
+                if chunk_id(symbol, interval, chunk_start, chunk_end) in done:
+                    continue
+                tasks.append(backfill_chunk(db, fetcher, semaphore, symbol, interval, chunk_start, chunk_end, done))
+
+        logger.info(f"Backfill: {len(tasks)} chunks to fetch, {len(done)} already done")
+        bars = sum(await asyncio.gather(*tasks))
+
+        if interval == "1day":
+            for symbol in symbols:
+                await rollups.rollup_prices(db, symbol)
+                # Backfilled bars are older than the cached tail
+                await columnar_store.mark_changed(db, symbol, "prices", rebuild=True)
+                await columnar_store.refresh(db, symbol, "prices", rebuild=True)
+
+    logger.info(f"Backfill finished: {bars} bars written")
+    return bars
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Resumable TwelveData historical backfill")
+    parser.add_argument("--symbols", nargs="+", help="defaults to the whole watchlist")
+    parser.add_argument("--interval", default="1day", help="TwelveData interval, e.g. 1day, 1h, 5min")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", default=datetime.utcnow(), type=datetime.fromisoformat)
+    parser.add_argument("--chunk-days", type=int, default=180,
+                        help="upper bound; intraday intervals use shorter chunks to stay under 5000 bars")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float,
+                        help="override TWELVEDATA_REQUESTS_PER_MINUTE for this run")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--record", metavar="DIR", help="save API responses to DIR")
+    source.add_argument("--replay", metavar="DIR", help="read responses from DIR instead of the API")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    fetcher = ReplayFetcher(args.replay) if args.replay else HttpFetcher(args.record)
+    if args.requests_per_minute:
+        # Every chunk shares the provider's token bucket
+        upstream.twelvedata.bucket.set_rate(args.requests_per_minute)
+    try:
+        if args.symbols:
+            symbols = [symbol.upper() for symbol in args.symbols]
+        else:
+            symbols = await watchlist.get_symbols()
+        await run_backfill(
+            symbols, args.interval, args.start, args.end,
+            chunk_days=args.chunk_days, concurrency=args.concurrency, fetcher=fetcher
+        )
+    finally:
+        await upstream.close()
+        await database.db_manager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main())
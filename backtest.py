@@ -0,0 +1,298 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import database
+import rollups
+import columnar_store
+import watchlist
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+# Upper bound on lookbacks x price thresholds x mention thresholds per run
+MAX_COMBINATIONS = int(os.getenv("BACKTEST_MAX_COMBINATIONS", "20000"))
+# Upper bound on cells (price thresholds x mention thresholds x bars) of the
+# float32 equity cube a worker holds at once for drawdowns (~4 bytes each,
+# twice over)
+DRAWDOWN_CELLS = int(os.getenv("BACKTEST_DRAWDOWN_CELLS", str(8_000_000)))
+
+# Default grid around the heuristics in analysis_etl.build_summary:
+# +/-1% price change, 20 (medium) and 50 (high) average mentions.
+DEFAULT_LOOKBACKS = [5, 10, 20, 30, 60]
+DEFAULT_PRICE_THRESHOLDS = [round(float(value), 2) for value in np.arange(-0.05, 0.1001, 0.01)]
+DEFAULT_MENTION_THRESHOLDS = [0, 5, 10, 20, 35, 50, 75, 100, 150, 200]
+METRICS = ["total_return", "hit_rate", "max_drawdown", "bars_in_market"]
+
+
+# --- DATA ---
+
+async def load_history(db, symbol: str):
+    """
+    Daily closes and the mention count in effect at each bar, oldest first,
+    as float arrays. Read from the columnar cache when it is enabled.
+    """
+    prices = await columnar_store.load_fresh(db, symbol, "prices")
+    if prices is None:
+        _, rows = await rollups.load_price_series(db, symbol, resolution="raw")
+        prices = {
+            "time": np.array([columnar_store.to_datetime64(row["datetime"]) for row in rows], dtype="datetime64[ms]"),
+            "close": np.array([row["close"] for row in rows], dtype=np.float64),
+        }
+    mentions = await columnar_store.load_fresh(db, symbol, "mentions")
+    if mentions is None:
+        _, rows = await rollups.load_mention_series(db, symbol, resolution="raw")
+        mentions = {
+            "time": np.array([columnar_store.to_datetime64(row["timestamp"]) for row in rows], dtype="datetime64[ms]"),
+            "mentions": np.array([row["mentions"] for row in rows], dtype=np.float64),
+        }
+    return np.asarray(prices["close"]), align_mentions(prices["time"], mentions["time"], mentions["mentions"])
+
+
+def align_mentions(bar_times: np.ndarray, snapshot_times: np.ndarray, mentions: np.ndarray):
+    """
+    Latest snapshot at or before each bar; NaN before the first snapshot,
+    so no signal fires on bars without social data.
+    """
+    if len(snapshot_times) == 0:
+        return np.full(len(bar_times), np.nan)
+    index = np.searchsorted(snapshot_times, bar_times, side="right") - 1
+    return np.where(index >= 0, np.asarray(mentions)[np.maximum(index, 0)], np.nan)
+
+
+# --- ENGINE ---
+
+def _trend(close: np.ndarray, lookback: int):
+    """
+    Price change over the last `lookback` bars; NaN until there is one.
+    """
+    trend = np.full(len(close), np.nan)
+    trend[lookback:] = close[lookback:] / close[:-lookback] - 1
+    return trend
+
+
+def _rolling_mean(values: np.ndarray, lookback: int):
+    """
+    Mean of the non-NaN values in each trailing window, NaN if none.
+    """
+    valid = ~np.isnan(values)
+    sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+    counts = np.concatenate([[0], np.cumsum(valid)])
+    window = np.maximum(np.arange(1, len(values) + 1) - lookback, 0)
+    total = sums[1:] - sums[window]
+    count = counts[1:] - counts[window]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def _max_drawdown(in_trend: np.ndarray, in_focus: np.ndarray, log_return: np.ndarray):
+    """
+    Max drawdown (P, M) of the equity paths of every (price, mention) pair
+    of a (P, T) and an (M, T) signal. Holds two (P, M, T) float32 arrays.
+    """
+    # Equity curves in log space: sums instead of products
+    log_equity = np.where(in_trend[:, None, :] & in_focus[None, :, :], log_return.astype(np.float32), np.float32(0))
+    np.cumsum(log_equity, axis=-1, out=log_equity)
+    # Peak includes the starting equity (log 0)
+    trough = -log_equity.min(axis=-1)
+    peak = np.maximum.accumulate(log_equity, axis=-1)
+    fall = np.maximum(np.subtract(peak, log_equity, out=peak).max(axis=-1), trough)
+    return -np.expm1(-np.maximum(fall, 0))
+
+
+def backtest_symbol(close: np.ndarray, mentions: np.ndarray, lookbacks, price_thresholds, mention_thresholds):
+    """
+    Long-only strategy: hold the next bar whenever the price change over
+    `lookback` bars exceeds the price threshold and the average mentions
+    over the same window reach the mention threshold.
+
+    The signal of a (price, mention) pair is the product of two indicator
+    rows, so returns, bars and hits of a whole lookback are matrix products
+    (P, T) @ (T, M). Drawdown needs every equity path and is computed on a
+    (P, M, T) float32 cube, a slice of price thresholds at a time so it
+    stays within DRAWDOWN_CELLS. Returns {metric: array (L, P, M)} plus
+    the buy-and-hold return.
+    """
+    price_thresholds = np.asarray(price_thresholds, dtype=np.float64)[:, None]
+    mention_thresholds = np.asarray(mention_thresholds, dtype=np.float64)[:, None]
+    shape = (len(lookbacks), len(price_thresholds), len(mention_thresholds))
+    results = {metric: np.zeros(shape) for metric in METRICS}
+
+    log_return = np.log1p(close[1:] / close[:-1] - 1)
+    up = log_return > 0
+    step = max(1, DRAWDOWN_CELLS // max(1, len(mention_thresholds) * len(log_return)))
+    for i, lookback in enumerate(lookbacks):
+        # NaN comparisons are False: no position until both inputs exist
+        with np.errstate(invalid="ignore"):
+            in_trend = _trend(close, lookback)[:-1] > price_thresholds          # (P, T)
+            in_focus = _rolling_mean(mentions, lookback)[:-1] >= mention_thresholds  # (M, T)
+        trend_rows = in_trend.astype(np.float64)
+        focus_rows = in_focus.astype(np.float64).T
+
+        results["total_return"][i] = np.expm1((trend_rows * log_return) @ focus_rows)
+        results["bars_in_market"][i] = trend_rows @ focus_rows
+        # Winning bars; divided by bars_in_market after pooling symbols
+        results["hit_rate"][i] = (trend_rows * up) @ focus_rows
+
+        for lo in range(0, len(price_thresholds), step):
+            results["max_drawdown"][i, lo:lo + step] = _max_drawdown(in_trend[lo:lo + step], in_focus, log_return)
+
+    results["buy_and_hold"] = close[-1] / close[0] - 1
+    return results
+
+
+# --- WORKER POOL ---
+# One pool per process, shared by every run (the app creates it in its
+# lifespan), so concurrent requests queue for workers instead of each
+# starting its own. Workers are spawned, not forked: a fork would inherit
+# Motor's monitor threads and locks held at that moment.
+_pool = None
+
+
+def get_pool(workers: int = None):
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=workers or BACKTEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def _run_symbol(args):
+    # Process pool entry point: (symbol, close, mentions, grid) -> (symbol, results)
+    symbol, close, mentions, grid = args
+    return symbol, backtest_symbol(close, mentions, *grid)
+
+
+def summarize(per_symbol: dict, lookbacks, price_thresholds, mention_thresholds, top: int):
+    """
+    Pool the per-symbol results for each parameter set and rank the sets
+    that traded by average total return across symbols.
+    """
+    stacked = {metric: np.stack([result[metric] for result in per_symbol.values()]) for metric in METRICS}
+    bars = stacked["bars_in_market"].sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        hit_rate = np.where(bars > 0, stacked["hit_rate"].sum(axis=0) / bars, np.nan)
+    mean_return = stacked["total_return"].mean(axis=0)
+    worst_drawdown = stacked["max_drawdown"].max(axis=0)
+    mean_drawdown = stacked["max_drawdown"].mean(axis=0)
+
+    # Sets that never enter the market are not strategies: rank them out
+    flat = np.where(bars > 0, mean_return, -np.inf).ravel()
+    k = min(top, int(np.isfinite(flat).sum()))
+    if k == 0:
+        return []
+    best = np.argpartition(-flat, k - 1)[:k]
+    best = best[np.argsort(-flat[best])]
+
+    ranking = []
+    for l, p, m in zip(*np.unravel_index(best, mean_return.shape)):
+        ranking.append({
+            "lookback": lookbacks[l],
+            "price_threshold": price_thresholds[p],
+            "mention_threshold": mention_thresholds[m],
+            "mean_total_return": mean_return[l, p, m],
+            "hit_rate": None if np.isnan(hit_rate[l, p, m]) else hit_rate[l, p, m],
+            "mean_max_drawdown": mean_drawdown[l, p, m],
+            "worst_max_drawdown": worst_drawdown[l, p, m],
+            "bars_in_market": int(bars[l, p, m]),
+        })
+    return ranking
+
+
+async def run_backtest(symbols: list[str] = None, lookbacks=None, price_thresholds=None,
+                       mention_thresholds=None, top: int = 20):
+    """
+    Sweep the parameter grid over the stored history of every symbol,
+    one symbol per job on the shared worker pool.
+    """
+    lookbacks = sorted(set(lookbacks or DEFAULT_LOOKBACKS))
+    price_thresholds = list(price_thresholds or DEFAULT_PRICE_THRESHOLDS)
+    mention_thresholds = list(mention_thresholds or DEFAULT_MENTION_THRESHOLDS)
+    combinations = len(lookbacks) * len(price_thresholds) * len(mention_thresholds)
+    if combinations > MAX_COMBINATIONS:
+        raise ValueError(f"{combinations} parameter combinations exceed the limit of {MAX_COMBINATIONS}")
+
+    db = await database.get_db()
+    symbols = symbols or await watchlist.get_symbols(db)
+    started = time.perf_counter()
+
+    histories = await asyncio.gather(*(load_history(db, symbol) for symbol in symbols))
+    grid = (lookbacks, price_thresholds, mention_thresholds)
+    jobs, skipped = [], []
+    for symbol, (close, mentions) in zip(symbols, histories):
+        if len(close) < max(lookbacks) + 2:
+            skipped.append(symbol)
+            continue
+        jobs.append((symbol, close, mentions, grid))
+
+    per_symbol = {}
+    if jobs:
+        loop = asyncio.get_running_loop()
+        pool = get_pool()
+        for symbol, result in await asyncio.gather(*(loop.run_in_executor(pool, _run_symbol, job) for job in jobs)):
+            per_symbol[symbol] = result
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Backtest of {combinations} combinations over {len(per_symbol)} symbols took {elapsed:.2f}s")
+    return {
+        "symbols": list(per_symbol),
+        "skipped": skipped,
+        "combinations": combinations,
+        "elapsed_s": round(elapsed, 3),
+        "buy_and_hold": {symbol: result["buy_and_hold"] for symbol, result in per_symbol.items()},
+        "top": summarize(per_symbol, lookbacks, price_thresholds, mention_thresholds, top) if per_symbol else [],
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backtest price-trend x mention-threshold strategies")
+    parser.add_argument("--symbols", nargs="+", help="defaults to the whole watchlist")
+    parser.add_argument("--lookbacks", nargs="+", type=int)
+    parser.add_argument("--price-thresholds", nargs="+", type=float, help="e.g. -0.02 0 0.01 0.05")
+    parser.add_argument("--mention-thresholds", nargs="+", type=float)
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--workers", type=int)
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    get_pool(args.workers)
+    try:
+        report = await run_backtest(
+            [symbol.upper() for symbol in args.symbols] if args.symbols else None,
+            args.lookbacks, args.price_thresholds, args.mention_thresholds, top=args.top
+        )
+    finally:
+        shutdown_pool()
+        await database.db_manager.close()
+
+    print(f"{report['combinations']} combinations x {len(report['symbols'])} symbols in {report['elapsed_s']}s")
+    if report["skipped"]:
+        print(f"Skipped (not enough history): {', '.join(report['skipped'])}")
+    print(f"{'lookback':>8} {'price':>7} {'mentions':>8} {'return':>8} {'hit':>6} {'mdd':>6} {'bars':>6}")
+    for row in report["top"]:
+        hit = f"{row['hit_rate']:.0%}" if row["hit_rate"] is not None else "-"
+        print(
+            f"{row['lookback']:>8} {row['price_threshold']:>7.2%} {row['mention_threshold']:>8g} "
+            f"{row['mean_total_return']:>8.2%} {hit:>6} {row['mean_max_drawdown']:>6.1%} {row['bars_in_market']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+import json
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from json_response import dumps
+
+# Shapes mirror /etl/twelvedata/results (8 symbols x 30 bars) scaled up,
+# and /analyze/{symbol} with long series.
+SYMBOLS = 50
+RECORDS_PER_SYMBOL = 500
+SERIES_LENGTH = 20000
+ROUNDS = 20
+
+
+def make_results():
+    start = datetime(2020, 1, 1)
+    return {
+        f"SYM{i}": [
+            {"_id": ObjectId(), "datetime": start + timedelta(days=j), "close": 100.0 + j * 0.1}
+            for j in range(RECORDS_PER_SYMBOL)
+        ]
+        for i in range(SYMBOLS)
+    }
+
+
+def make_analysis():
+    prices = np.random.default_rng(0).normal(100, 5, SERIES_LENGTH)
+    return {
+        "symbol": "AAPL",
+        "td_last_price": prices[-1],
+        "correlation": np.float64(0.42),
+        "td_prices_series": prices.tolist(),
+        "aw_mentions_series": prices.tolist(),
+        "analysis_timestamp": datetime.utcnow(),
+    }
+
+
+def legacy(payload):
+    """
+    What the endpoints did before: stringify ids/timestamps in Python loops,
+    then let FastAPI run jsonable_encoder and the stdlib encoder.
+    """
+    if isinstance(payload, dict) and "td_prices_series" not in payload:
+        for records in payload.values():
+            for record in records:
+                record["_id"] = str(record["_id"])
+                record["datetime"] = record["datetime"].isoformat()
+    else:
+        payload["td_last_price"] = float(payload["td_last_price"])
+        payload["correlation"] = float(payload["correlation"])
+        payload["analysis_timestamp"] = payload["analysis_timestamp"].isoformat()
+    return json.dumps(jsonable_encoder(payload)).encode("utf-8")
+
+
+def bench(name, factory, encoder):
+    elapsed = 0.0
+    size = 0
+    for _ in range(ROUNDS):
+        payload = factory()
+        started = time.perf_counter()
+        size = len(encoder(payload))
+        elapsed += time.perf_counter() - started
+    return elapsed / ROUNDS * 1000, size
+
+
+if __name__ == "__main__":
+    for name, factory in (("results", make_results), ("analyze", make_analysis)):
+        old_ms, old_size = bench(name, factory, legacy)
+        new_ms, new_size = bench(name, factory, dumps)
+        print(
+            f"{name:8s} legacy {old_ms:8.2f} ms ({old_size} B) | "
+            f"orjson {new_ms:8.2f} ms ({new_size} B) | "
+            f"speedup x{old_ms / new_ms:.1f}"
+        )
@@ -1,31 +1,50 @@
 import asyncio
+import argparse
+from datetime import datetime, timedelta
 import database
-from motor.motor_asyncio import AsyncIOMotorClient
-import certifi
-import os
-from dotenv import load_dotenv
+import logs_query
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Query the application logs collection")
+    parser.add_argument("--level", nargs="+", type=str.upper, choices=logs_query.LEVELS)
+    parser.add_argument("--logger", help="exact logger name, e.g. twelvedata_etl")
+    parser.add_argument("--since-hours", type=float, default=24, help="look back this many hours")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--cursor", help="next_cursor printed by a previous run")
+    parser.add_argument("--histogram", choices=logs_query.BUCKET_UNITS,
+                        help="print counts per level per bucket instead of entries")
+    return parser.parse_args()
 
-load_dotenv()
 
 async def check_logs():
-    print("Connecting to MongoDB...")
-    client = AsyncIOMotorClient(
-        os.getenv("MONGODB_URI"),
-        tls=True,
-        tlsCAFile=certifi.where()
-    )
-    db = client[os.getenv("DB_NAME")]
-    
-    print("Checking logs collection...")
-    count = await db["logs"].count_documents({})
-    print(f"Total logs found: {count}")
-    
-    if count > 0:
-        print("Latest 5 logs:")
-        async for log in db["logs"].find().sort("timestamp", -1).limit(5):
-            print(f"- {log['timestamp']} [{log['level']}] {log['message']}")
-    else:
-        print("No logs found.")
+    args = parse_args()
+    start = datetime.utcnow() - timedelta(hours=args.since_hours)
+    db = await database.db_manager.connect(warm_up=False)
+    try:
+        if args.histogram:
+            buckets = await logs_query.histogram(
+                db, args.histogram, levels=args.level, logger_name=args.logger, start=start
+            )
+            for bucket in buckets:
+                counts = ", ".join(f"{level}={count}" for level, count in sorted(bucket["counts"].items()))
+                print(f"{bucket['bucket']}  total={bucket['total']}  {counts}")
+            if not buckets:
+                print("No logs found.")
+            return
+
+        page = await logs_query.query_logs(
+            db, args.level, args.logger, start=start, cursor=args.cursor, limit=args.limit
+        )
+        for log in page["entries"]:
+            print(f"- {log['timestamp']} [{log['level']}] {log.get('logger', '')}: {log['message']}")
+        if not page["entries"]:
+            print("No logs found.")
+        if page["next_cursor"]:
+            print(f"More: --cursor {page['next_cursor']}")
+    finally:
+        await database.db_manager.close()
+
 
 if __name__ == "__main__":
     asyncio.run(check_logs())
@@ -0,0 +1,344 @@
+import os
+import json
+import uuid
+import shutil
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timezone
+from contextlib import asynccontextmanager
+import numpy as np
+import database
+import watchlist
+
+try:
+    # Serializes refreshes across worker processes; POSIX only
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+# Directory of the local columnar cache. Unset (or a platform without
+# fcntl) disables it and every read goes to MongoDB as before.
+COLUMNAR_CACHE_DIR = os.getenv("COLUMNAR_CACHE_DIR")
+# Per-series write generations in MongoDB, shared by every node. Writers bump
+# them; a node whose cache is behind refreshes before serving from it.
+GENERATION_COLLECTION = "columnar_generations"
+TIME_DTYPE = np.dtype("datetime64[ms]")
+VALUE_DTYPE = np.dtype("float64")
+
+# One entry per cached series: the raw collection it mirrors, its time
+# field (indexed, used for incremental refreshes) and its numeric columns.
+# Rows whose first column is missing are not cached, as in the raw readers.
+SERIES = {
+    "prices": {
+        "collection": "td_prices_{symbol}",
+        "time_field": "datetime",
+        "columns": ["close"],
+    },
+    "mentions": {
+        "collection": "apewisdom_{symbol}",
+        "time_field": "timestamp",
+        "columns": ["mentions", "upvotes", "rank"],
+    },
+}
+
+
+def enabled():
+    return bool(COLUMNAR_CACHE_DIR) and fcntl is not None
+
+
+# --- FILE LAYOUT ---
+# {COLUMNAR_CACHE_DIR}/{SYMBOL}/{series}.{token}/{column}.bin  raw little-endian arrays
+# {COLUMNAR_CACHE_DIR}/{SYMBOL}/{series}.meta.json             current token, row count,
+#                                                              tail time, generations
+# Columns are append-only within a token directory. The meta file is replaced
+# atomically after the data is written, so readers never see a partial row
+# and an interrupted refresh only leaves bytes past "count" that the next
+# refresh truncates. A rebuild writes a new token directory and switches to
+# it with the same single meta replace, so a reader always maps columns of
+# one generation. One meta file per series lets the two ETLs refresh a
+# symbol concurrently.
+
+def _symbol_dir(symbol: str):
+    return os.path.join(COLUMNAR_CACHE_DIR, symbol)
+
+
+def _column_path(symbol: str, directory: str, column: str):
+    return os.path.join(_symbol_dir(symbol), directory, f"{column}.bin")
+
+
+def _meta_path(symbol: str, series: str):
+    return os.path.join(_symbol_dir(symbol), f"{series}.meta.json")
+
+
+def read_meta(symbol: str, series: str):
+    try:
+        with open(_meta_path(symbol, series)) as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        meta = {}
+    if "dir" not in meta:
+        # Never built (or built by an older layout): rebuild on next refresh
+        return {"count": 0}
+    return meta
+
+
+def _write_meta(symbol: str, series: str, meta: dict):
+    path = _meta_path(symbol, series)
+    with open(path + ".tmp", "w") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+
+
+def _dtype(column: str):
+    return TIME_DTYPE if column == "time" else VALUE_DTYPE
+
+
+def _all_columns(series: str):
+    return ["time", *SERIES[series]["columns"]]
+
+
+def to_datetime64(value: datetime):
+    # MongoDB stores naive UTC; query parameters may carry a timezone
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "ms")
+
+
+def load(symbol: str, series: str, start: datetime = None, end: datetime = None):
+    """
+    Oldest-first columns {"time", <columns>} for [start, end] as read-only
+    memory-mapped arrays: no copy, no per-row objects. None when the
+    series is not cached.
+    """
+    if not enabled():
+        return None
+    meta = read_meta(symbol, series)
+    count = meta["count"]
+    if count == 0:
+        return None
+    columns = {
+        column: np.memmap(_column_path(symbol, meta["dir"], column), dtype=_dtype(column), mode="r", shape=(count,))
+        for column in _all_columns(series)
+    }
+    times = columns["time"]
+    lo = np.searchsorted(times, to_datetime64(start), side="left") if start is not None else 0
+    hi = np.searchsorted(times, to_datetime64(end), side="right") if end is not None else count
+    return {column: values[lo:hi] for column, values in columns.items()}
+
+
+def _pipeline(series: str, since: datetime = None):
+    spec = SERIES[series]
+    time_field = spec["time_field"]
+    first = spec["columns"][0]
+    to_double = lambda field: {"$convert": {"input": f"${field}", "to": "double", "onError": None, "onNull": None}}
+    pipeline = []
+    if since is not None:
+        pipeline.append({"$match": {time_field: {"$gte": since}}})
+    pipeline += [
+        # Snapshots stored before they carried a timestamp use the ObjectId time
+        {"$project": {
+            "time": {"$ifNull": [f"${time_field}", {"$toDate": "$_id"}]},
+            **{column: to_double(column) for column in spec["columns"]},
+        }},
+        {"$match": {first: {"$ne": None}}},
+        # Same time stored twice (re-fetched bars): the later insert wins below
+        {"$sort": {"time": 1, "_id": 1}},
+    ]
+    return pipeline
+
+
+def _to_columns(series: str, docs: list[dict]):
+    columns = {
+        column: np.fromiter(
+            (doc.get(column) if doc.get(column) is not None else np.nan for doc in docs),
+            dtype=_dtype(column) if column != "time" else object,
+            count=len(docs)
+        )
+        for column in _all_columns(series)
+    }
+    columns["time"] = columns["time"].astype(TIME_DTYPE)
+    # Keep the last row per timestamp; np.unique on the reversed times
+    # returns first occurrences, i.e. the latest inserts
+    _, reversed_index = np.unique(columns["time"][::-1], return_index=True)
+    keep = len(docs) - 1 - reversed_index
+    return {column: values[keep] for column, values in columns.items()}
+
+
+def _append(symbol: str, directory: str, series: str, count: int, new: dict):
+    """
+    Overwrite the cached tail row when the refresh re-read it, append the
+    rest. Returns the new row count.
+    """
+    last_time = np.memmap(_column_path(symbol, directory, "time"), dtype=TIME_DTYPE, mode="r", shape=(count,))[-1]
+    overlap = int(new["time"][0] == last_time)
+
+    for column in _all_columns(series):
+        itemsize = _dtype(column).itemsize
+        with open(_column_path(symbol, directory, column), "r+b") as f:
+            f.truncate(count * itemsize)
+            f.seek((count - overlap) * itemsize)
+            f.write(np.ascontiguousarray(new[column], dtype=_dtype(column)).tobytes())
+    return count - overlap + len(new["time"])
+
+
+def _rewrite(symbol: str, series: str, new: dict, previous: str = None):
+    """
+    Write every column into a new token directory and return its name.
+    The caller switches to it through the meta file. Directories older
+    than `previous` are removed; `previous` itself is kept for readers
+    that loaded the old meta and have not mapped its files yet.
+    """
+    directory = f"{series}.{uuid.uuid4().hex[:12]}"
+    os.makedirs(os.path.join(_symbol_dir(symbol), directory))
+    for column in _all_columns(series):
+        with open(_column_path(symbol, directory, column), "wb") as f:
+            f.write(np.ascontiguousarray(new[column], dtype=_dtype(column)).tobytes())
+
+    for entry in os.listdir(_symbol_dir(symbol)):
+        path = os.path.join(_symbol_dir(symbol), entry)
+        if entry.startswith(f"{series}.") and os.path.isdir(path) and entry not in (directory, previous):
+            shutil.rmtree(path, ignore_errors=True)
+    return directory
+
+
+# --- FRESHNESS ---
+
+def _generation_id(symbol: str, series: str):
+    return f"{symbol}:{series}"
+
+
+async def mark_changed(db, symbol: str, series: str, rebuild: bool = False):
+    """
+    Record in MongoDB that raw rows of a series were written. `rebuild`
+    flags writes older than the tail (backfills), which an incremental
+    refresh would miss. Called whether or not this node caches.
+    """
+    increments = {"generation": 1, "rebuild_generation": 1} if rebuild else {"generation": 1}
+    await db[GENERATION_COLLECTION].update_one(
+        {"_id": _generation_id(symbol, series)}, {"$inc": increments}, upsert=True
+    )
+
+
+async def _remote_generation(db, symbol: str, series: str):
+    doc = await db[GENERATION_COLLECTION].find_one({"_id": _generation_id(symbol, series)}) or {}
+    return doc.get("generation", 0), doc.get("rebuild_generation", 0)
+
+
+def _is_current(meta: dict, generation: int, rebuild_generation: int):
+    return (
+        "dir" in meta
+        and meta.get("generation", 0) >= generation
+        and meta.get("rebuild_generation", 0) >= rebuild_generation
+    )
+
+
+# In-process lock per series, plus a file lock for other worker processes
+# sharing the same cache directory.
+_locks = {}
+
+
+@asynccontextmanager
+async def _series_lock(symbol: str, series: str):
+    async with _locks.setdefault((symbol, series), asyncio.Lock()):
+        with open(os.path.join(_symbol_dir(symbol), f"{series}.lock"), "w") as f:
+            await asyncio.to_thread(fcntl.flock, f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+async def load_fresh(db, symbol: str, series: str, start: datetime = None, end: datetime = None):
+    """
+    load() after making sure the local cache has caught up with the
+    generation recorded in MongoDB (one _id lookup). Nodes that never run
+    the ETLs refresh themselves here.
+    """
+    if not enabled():
+        return None
+    generation, rebuild_generation = await _remote_generation(db, symbol, series)
+    if not _is_current(read_meta(symbol, series), generation, rebuild_generation):
+        await refresh(db, symbol, series)
+    return load(symbol, series, start, end)
+
+
+# --- REFRESH ---
+
+async def _refresh_series(db, symbol: str, name: str, rebuild: bool):
+    # Generations are read before the rows, so the rows are at least that new
+    generation, rebuild_generation = await _remote_generation(db, symbol, name)
+    meta = read_meta(symbol, name)
+    incremental = (
+        meta["count"] > 0 and not rebuild
+        and meta.get("rebuild_generation", 0) >= rebuild_generation
+    )
+    since = datetime.fromisoformat(meta["last_time"]) if incremental else None
+
+    collection = SERIES[name]["collection"].format(symbol=symbol)
+    docs = await db[collection].aggregate(_pipeline(name, since)).to_list(length=None)
+    state = {"generation": generation, "rebuild_generation": rebuild_generation}
+    if incremental:
+        count = meta["count"]
+        if docs:
+            new = _to_columns(name, docs)
+            count = _append(symbol, meta["dir"], name, count, new)
+            meta["last_time"] = new["time"][-1].astype(datetime).isoformat()
+        _write_meta(symbol, name, {**meta, **state, "count": count})
+        return count
+
+    new = _to_columns(name, docs) if docs else {column: np.empty(0, _dtype(column)) for column in _all_columns(name)}
+    directory = _rewrite(symbol, name, new, previous=meta.get("dir"))
+    last_time = new["time"][-1].astype(datetime).isoformat() if docs else None
+    _write_meta(symbol, name, {**state, "dir": directory, "count": len(new["time"]), "last_time": last_time})
+    return len(new["time"])
+
+
+async def refresh(db, symbol: str, series: str = None, rebuild: bool = False):
+    """
+    Bring the cached series of a symbol up to date with MongoDB. Only rows
+    at or after the cached tail are read, unless `rebuild` is set or a
+    writer flagged a rebuild (a backfill inserted bars older than the tail).
+    Returns {series: rows cached}.
+    """
+    if not enabled():
+        return {}
+    os.makedirs(_symbol_dir(symbol), exist_ok=True)
+    result = {}
+    for name in [series] if series else SERIES:
+        async with _series_lock(symbol, name):
+            result[name] = await _refresh_series(db, symbol, name, rebuild)
+
+    logger.info(f"Columnar cache for {symbol}: {result}")
+    return result
+
+
+async def refresh_all(symbols: list[str], rebuild: bool = False):
+    db = await database.get_db()
+    return {symbol: await refresh(db, symbol, rebuild=rebuild) for symbol in symbols}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Refresh the local columnar price/mention cache")
+    parser.add_argument("--symbols", nargs="+", help="defaults to the whole watchlist")
+    parser.add_argument("--rebuild", action="store_true", help="re-read the full history")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    if not enabled():
+        raise SystemExit("COLUMNAR_CACHE_DIR is not set" if fcntl is not None else "The columnar cache needs fcntl (POSIX)")
+    try:
+        symbols = [symbol.upper() for symbol in args.symbols] if args.symbols else await watchlist.get_symbols()
+        await refresh_all(symbols, rebuild=args.rebuild)
+    finally:
+        await database.db_manager.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    asyncio.run(main())
@@ -1,5 +1,8 @@
 import os
+import asyncio
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
 from dotenv import load_dotenv
 import certifi
 import logging
@@ -14,26 +17,208 @@ load_dotenv()
 MONGO_URL = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME")
 
+# Pool tuning. Defaults match the driver's own defaults except for the
+# warm pool, so behaviour is unchanged unless the environment says otherwise.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "5"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0")) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "0")) or None
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+# TLS is required by Atlas (mongodb+srv://) but not by a local mongod.
+# Leave MONGO_TLS unset to decide from the URI scheme.
+MONGO_TLS = os.getenv("MONGO_TLS")
+# How long shutdown waits for in-flight operations before closing the pool.
+MONGO_DRAIN_TIMEOUT_S = float(os.getenv("MONGO_DRAIN_TIMEOUT_S", "10"))
+# /health gives up after this long instead of waiting for server selection.
+MONGO_HEALTH_TIMEOUT_S = float(os.getenv("MONGO_HEALTH_TIMEOUT_S", "2"))
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Connection pool listener that keeps running counters so the pool can be
+    inspected from /health without touching the driver's internals.
+    """
+
+    def __init__(self):
+        self.open = 0
+        self.checked_out = 0
+        self.total_checkouts = 0
+        self.failed_checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.cleared = 0
+
+    def _record_wait(self, event):
+        # ConnectionCheckedOut/CheckOutFailed carry a duration on pymongo >= 4.7
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            wait_ms = duration * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.open = max(self.open - 1, 0)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.failed_checkouts += 1
+        self._record_wait(event)
+
+    def connection_checked_out(self, event):
+        self.checked_out += 1
+        self.total_checkouts += 1
+        self._record_wait(event)
+
+    def connection_checked_in(self, event):
+        self.checked_out = max(self.checked_out - 1, 0)
+
+    def snapshot(self):
+        avg_wait = self.total_wait_ms / self.total_checkouts if self.total_checkouts else 0.0
+        return {
+            "open_connections": self.open,
+            "checked_out": self.checked_out,
+            "total_checkouts": self.total_checkouts,
+            "failed_checkouts": self.failed_checkouts,
+            "avg_wait_ms": round(avg_wait, 3),
+            "max_wait_ms": round(self.max_wait_ms, 3),
+            "pool_cleared": self.cleared,
+            "max_pool_size": MONGO_MAX_POOL_SIZE,
+            "min_pool_size": MONGO_MIN_POOL_SIZE,
+        }
+
+
+def client_options():
+    """
+    Keyword arguments for AsyncIOMotorClient built from the environment.
+    """
+    if MONGO_TLS is None:
+        use_tls = bool(MONGO_URL) and MONGO_URL.startswith("mongodb+srv://")
+    else:
+        use_tls = MONGO_TLS.lower() in ("1", "true", "yes")
+
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "readPreference": MONGO_READ_PREFERENCE,
+    }
+    if use_tls:
+        options["tls"] = True
+        options["tlsCAFile"] = certifi.where()
+    return options
+
+
 class Database:
+    """
+    Owns the single MongoDB client of the process: creation, warm-up,
+    health checks and graceful shutdown all go through here.
+    """
     client: AsyncIOMotorClient = None
     db = None
 
+    def __init__(self):
+        self.pool_stats = PoolStats()
+        self._lock = None
+
+    async def connect(self, warm_up: bool = True):
+        """
+        Create the client once. Concurrent callers wait on the same lock,
+        so a lazy get_db() racing with startup never builds a second client.
+        """
+        if self.db is not None:
+            return self.db
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.db is None:
+                logger = logging.getLogger(__name__)
+                logger.info("Initializing MongoDB connection...")
+                self.client = AsyncIOMotorClient(
+                    MONGO_URL,
+                    event_listeners=[self.pool_stats],
+                    **client_options()
+                )
+                self.db = self.client[DB_NAME]
+                if warm_up:
+                    await self.warm_up()
+        return self.db
+
+    async def warm_up(self, connections: int = None):
+        """
+        Open pooled connections eagerly by running concurrent pings, so the
+        first requests after startup don't pay the TCP/TLS handshake.
+        """
+        connections = connections or max(MONGO_MIN_POOL_SIZE, 1)
+        await asyncio.gather(*(self.client.admin.command("ping") for _ in range(connections)))
+        logging.getLogger(__name__).info(
+            f"MongoDB pool warmed up ({self.pool_stats.open} connections open)"
+        )
+
+    async def ping(self, timeout: float = None):
+        """
+        Round-trip latency to the server in milliseconds. Raises
+        asyncio.TimeoutError after `timeout` seconds.
+        """
+        started = time.perf_counter()
+        await asyncio.wait_for(self.client.admin.command("ping"), timeout)
+        return round((time.perf_counter() - started) * 1000, 3)
+
+    async def close(self, timeout: float = MONGO_DRAIN_TIMEOUT_S):
+        """
+        Wait for checked-out connections to come back (bounded by timeout),
+        then close the client.
+        """
+        if self.client is None:
+            return
+        logger = logging.getLogger(__name__)
+        deadline = time.monotonic() + timeout
+        while self.pool_stats.checked_out > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self.pool_stats.checked_out > 0:
+            logger.warning(
+                f"Closing MongoDB client with {self.pool_stats.checked_out} connections still in use"
+            )
+        self.client.close()
+        self.client = None
+        self.db = None
+
+
 db_manager = Database()
 
 async def get_db():
     """
     Dependency that returns the database object.
-    Note: Motor handles connection pooling efficiently, so we don't need 
+    Note: Motor handles connection pooling efficiently, so we don't need
     to open/close connections per request like we do with SQL sessions.
     """
     if db_manager.db is None:
-        logger = logging.getLogger(__name__)
-        logger.info("Initializing MongoDB connection...")
         # Lazy initialization if needed, though main.py usually handles startup
-        db_manager.client = AsyncIOMotorClient(
-            MONGO_URL,
-            tls=True,
-            tlsCAFile=certifi.where()
-        )
-        db_manager.db = db_manager.client[DB_NAME]
+        await db_manager.connect()
     return db_manager.db
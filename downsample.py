@@ -0,0 +1,81 @@
+from datetime import datetime
+import numpy as np
+from rollups import to_naive_utc
+
+# Bounds for the max_points query parameter of chart endpoints
+MIN_POINTS = 3
+MAX_POINTS = 10000
+EPOCH = datetime(1970, 1, 1)
+
+
+def lttb_indices(x, y, max_points: int):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; the points in between are
+    split into max_points - 2 buckets and each bucket keeps the point that
+    forms the largest triangle with the previously kept point and the
+    average of the next bucket. Bucket averages are computed for all
+    buckets at once; only the per-bucket argmax walks the buckets, since
+    each choice depends on the previous one. Missing values (NaN) are
+    left out of the averages and never chosen over a real point.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+
+    # Bucket b holds the interior points [edges[b], edges[b + 1])
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    valid = ~np.isnan(y)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / sizes
+    # Mean of the real values; NaN for a bucket without any
+    with np.errstate(invalid="ignore"):
+        avg_y = (np.add.reduceat(np.where(valid, y, 0.0)[:n - 1], edges[:-1])
+                 / np.add.reduceat(valid[:n - 1].astype(np.float64), edges[:-1]))
+    # Third vertex of each bucket's triangles: the next bucket's average,
+    # or the last point for the last bucket
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for b in range(max_points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        # No real value ahead: measure against the previous point's level
+        third_y = next_y[b] if not np.isnan(next_y[b]) else y[a]
+        # Twice the triangle area; the factor does not change the argmax
+        area = np.abs((x[a] - next_x[b]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (third_y - y[a]))
+        chosen = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        kept[b + 1] = chosen
+        # A bucket of only NaN keeps one, but later triangles start from
+        # the last real point
+        if valid[chosen] or not valid[a]:
+            a = chosen
+    return kept
+
+
+def downsample_series(values: list, max_points: int = None):
+    """
+    Evenly spaced series (oldest first) reduced to at most max_points.
+    """
+    if not max_points or len(values) <= max_points:
+        return values
+    return [values[i] for i in lttb_indices(np.arange(len(values)), values, max_points)]
+
+
+def downsample_rows(rows: list[dict], time_key: str, value_key: str, max_points: int = None):
+    """
+    Rows of a time series (oldest first) reduced to at most max_points,
+    keeping the shape of `value_key` over `time_key`. Times may mix naive
+    UTC and timezone-aware values (legacy ObjectId times).
+    """
+    if not max_points or len(rows) <= max_points:
+        return rows
+    # Seconds since the epoch in UTC; naive datetime.timestamp() would use local time
+    x = [(to_naive_utc(row[time_key]) - EPOCH).total_seconds() for row in rows]
+    y = [row[value_key] for row in rows]
+    return [rows[i] for i in lttb_indices(x, y, max_points)]
@@ -0,0 +1,205 @@
+import os
+import sys
+import uuid
+import socket
+import asyncio
+import logging
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+LOCK_COLLECTION = "etl_locks"
+# A lease not renewed for this long is considered abandoned and can be taken over.
+ETL_LEASE_TTL_S = float(os.getenv("ETL_LEASE_TTL_S", "60"))
+# Identifies this worker process across the cluster; each Lease adds its own suffix.
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def new_holder_id():
+    """
+    Unique per Lease instance, so two runs in the same process never share
+    (or release) each other's lease.
+    """
+    return f"{PROCESS_ID}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseHeldError(Exception):
+    """
+    Raised when another worker currently holds the lease.
+    """
+
+    def __init__(self, name: str, holder: str = None):
+        self.name = name
+        self.holder = holder
+        super().__init__(f"ETL '{name}' is already running on {holder or 'another worker'}")
+
+
+class Lease:
+    """
+    Lease-based distributed lock stored in MongoDB.
+
+    One document per lock name: {_id, holder, expires_at, heartbeat_at,
+    acquired_at, fencing_token}. Expiry is computed with the server clock
+    ($$NOW), so workers on different nodes don't need synchronized clocks.
+    While held, a background task renews the lease every ttl/3; if the
+    holder dies, the lease expires and the next worker takes it over.
+    Only the same Lease instance can re-acquire a lease it holds. Release
+    clears the holder but keeps the document, so fencing tokens keep
+    increasing across holders.
+    """
+
+    def __init__(self, db, name: str, ttl: float = ETL_LEASE_TTL_S, holder: str = None):
+        self.collection = db[LOCK_COLLECTION]
+        self.name = name
+        self.ttl_ms = int(ttl * 1000)
+        self.holder = holder or new_holder_id()
+        self.fencing_token = None
+        self.lost = False
+        self._heartbeat_task = None
+
+    def _expiry(self):
+        return {"$add": ["$$NOW", self.ttl_ms]}
+
+    async def acquire(self):
+        """
+        Take the lease if it is free, released, expired or already held by
+        this instance.
+        Returns True on success, False if another worker holds it.
+        """
+        try:
+            doc = await self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"holder": self.holder},
+                        {"holder": None},
+                        {"$expr": {"$lt": ["$expires_at", "$$NOW"]}},
+                    ],
+                },
+                [{"$set": {
+                    "holder": self.holder,
+                    "expires_at": self._expiry(),
+                    "heartbeat_at": "$$NOW",
+                    "acquired_at": "$$NOW",
+                    "fencing_token": {"$add": [{"$ifNull": ["$fencing_token", 0]}, 1]},
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The document exists and is held by a live worker
+            return False
+        self.fencing_token = doc["fencing_token"]
+        self.lost = False
+        return True
+
+    async def renew(self):
+        """
+        Extend the lease. Returns False if it was taken over meanwhile.
+        """
+        result = await self.collection.update_one(
+            {"_id": self.name, "holder": self.holder},
+            [{"$set": {"expires_at": self._expiry(), "heartbeat_at": "$$NOW"}}],
+        )
+        return result.matched_count == 1
+
+    async def release(self):
+        await self.collection.update_one(
+            {"_id": self.name, "holder": self.holder},
+            [{"$set": {"holder": None, "expires_at": "$$NOW"}}],
+        )
+
+    async def current_holder(self):
+        doc = await self.collection.find_one({"_id": self.name})
+        return doc.get("holder") if doc else None
+
+    async def _heartbeat(self):
+        interval = self.ttl_ms / 3000
+        loop_time = asyncio.get_running_loop().time
+        last_renewed = loop_time()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await self.renew()
+            except Exception as exc:
+                # Keep trying until the lease would have expired anyway
+                logger.warning(f"Lease '{self.name}' renewal failed: {exc}")
+                if loop_time() - last_renewed >= self.ttl_ms / 1000:
+                    self.lost = True
+                    logger.error(f"Lease '{self.name}' expired on {self.holder} after failed renewals")
+                    return
+                continue
+            if not renewed:
+                self.lost = True
+                logger.error(f"Lease '{self.name}' was lost by {self.holder}")
+                return
+            last_renewed = loop_time()
+
+    async def __aenter__(self):
+        if not await self.acquire():
+            raise LeaseHeldError(self.name, await self.current_holder())
+        logger.info(f"Lease '{self.name}' acquired by {self.holder} (token {self.fencing_token})")
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._heartbeat_task.cancel()
+        try:
+            await self._heartbeat_task
+        except asyncio.CancelledError:
+            pass
+        if not self.lost:
+            await self.release()
+            logger.info(f"Lease '{self.name}' released by {self.holder}")
+        return False
+
+
+def lease(db, name: str, ttl: float = ETL_LEASE_TTL_S):
+    """
+    async with lease(db, "twelvedata") as held: ...
+    Raises LeaseHeldError if another worker is running the same ETL.
+    """
+    return Lease(db, name, ttl=ttl)
+
+
+# --- LOCAL MULTI-PROCESS CHECK ---
+# Start several workers against a local Mongo and watch them take turns:
+#   MONGODB_URI=mongodb://localhost:27017 DB_NAME=test python etl_lock.py 4
+# One worker exits without releasing to show takeover after the TTL.
+
+def _demo_worker(index: int, ttl: float, rounds: int):
+    import database
+
+    async def run():
+        db = await database.db_manager.connect(warm_up=False)
+        me = Lease(db, "demo", ttl=ttl, holder=f"worker-{index}:{os.getpid()}")
+        for _ in range(rounds):
+            if await me.acquire():
+                print(f"[{me.holder}] acquired (token {me.fencing_token})", flush=True)
+                if index == 0:
+                    print(f"[{me.holder}] crashing without release", flush=True)
+                    os._exit(1)
+                await asyncio.sleep(ttl / 2)
+                await me.release()
+                print(f"[{me.holder}] released", flush=True)
+            await asyncio.sleep(ttl / 4)
+        await database.db_manager.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    import multiprocessing
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    ttl = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    processes = [
+        multiprocessing.Process(target=_demo_worker, args=(i, ttl, 8))
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections import defaultdict
+from json_response import dumps
+from analysis_etl import analyze_symbol
+from downsample import downsample_series
+
+logger = logging.getLogger(__name__)
+
+# Per-subscriber buffer. A client that falls this far behind loses its
+# oldest events rather than holding memory for everyone.
+SUBSCRIBER_QUEUE_SIZE = 16
+# Comment lines keep idle connections open through proxies.
+KEEPALIVE_S = 15
+
+
+def format_sse(event: str, data: bytes):
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class Broadcaster:
+    """
+    In-process pub/sub for Server-Sent Events.
+
+    Each publish encodes the payload once and hands the same bytes to every
+    subscriber of the topic, so the cost of an update does not grow with the
+    number of open dashboards. The last message per topic is kept while the
+    topic has subscribers, so new subscribers get the current state without
+    recomputing it.
+
+    Only subscribers connected to this worker are reached; ETL runs publish
+    from the worker that executed them (see "Live updates" in the README).
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._last = {}
+
+    def subscribe(self, topic: str):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers[topic].add(queue)
+        if topic in self._last:
+            queue.put_nowait(self._last[topic])
+        return queue
+
+    def unsubscribe(self, topic: str, queue):
+        self._subscribers[topic].discard(queue)
+        if not self._subscribers[topic]:
+            del self._subscribers[topic]
+            self._last.pop(topic, None)
+
+    def subscriber_count(self, topic: str):
+        return len(self._subscribers.get(topic, ()))
+
+    def topics(self):
+        return list(self._subscribers)
+
+    def last(self, topic: str):
+        return self._last.get(topic)
+
+    def publish(self, topic: str, event: str, content, retain: bool = True):
+        """
+        Send to every subscriber of the topic. retain=False is for
+        notifications that new subscribers should not replay.
+        """
+        message = format_sse(event, dumps(content))
+        if retain and topic in self._subscribers:
+            self._last[topic] = message
+        for queue in self._subscribers.get(topic, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+        return self.subscriber_count(topic)
+
+
+broadcaster = Broadcaster()
+
+
+def analysis_topic(symbol: str, max_points: int = None):
+    # One topic per chart resolution, so each subscriber gets the series it asked for
+    return f"analysis:{symbol}:{max_points}" if max_points else f"analysis:{symbol}"
+
+
+def _analysis_topics(symbol: str):
+    """
+    (topic, max_points) of every analysis stream of the symbol with
+    subscribers on this worker.
+    """
+    base = analysis_topic(symbol)
+    found = []
+    for topic in broadcaster.topics():
+        if topic == base:
+            found.append((topic, None))
+        elif topic.startswith(base + ":"):
+            found.append((topic, int(topic[len(base) + 1:])))
+    return found
+
+
+RESULTS_TOPIC = "results"
+USERS_TOPIC = "users"
+
+
+async def stream(request, topic: str, initial: tuple = None):
+    """
+    Async generator of SSE frames for one subscriber, ending when the
+    client disconnects. `initial` is an (event, content) pair published
+    on connect when the topic has no retained state yet.
+    """
+    queue = broadcaster.subscribe(topic)
+    if initial is not None and broadcaster.last(topic) is None:
+        broadcaster.publish(topic, *initial)
+    try:
+        while not await request.is_disconnected():
+            try:
+                yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_S)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+    finally:
+        broadcaster.unsubscribe(topic, queue)
+
+
+async def publish_analysis(symbols):
+    """
+    Recompute the analysis once per symbol that has live subscribers on
+    this worker and push it to all of them, with the chart series
+    downsampled to each stream's max_points.
+    """
+    for symbol in symbols:
+        topics = _analysis_topics(symbol)
+        if not topics:
+            continue
+        try:
+            analysis = await analyze_symbol(symbol)
+        except Exception as exc:
+            logger.error(f"Could not publish analysis for {symbol}: {exc}")
+            continue
+        delivered = 0
+        for topic, max_points in topics:
+            delivered += broadcaster.publish(topic, "analysis", {
+                **analysis,
+                "td_prices_series": downsample_series(analysis["td_prices_series"], max_points),
+                "aw_mentions_series": downsample_series(analysis["aw_mentions_series"], max_points),
+            })
+        logger.info(f"Published analysis for {symbol} to {delivered} subscribers")
+
+
+async def etl_completed(source: str, data: dict):
+    """
+    Called by the ETLs after a run: pushes the new records to the admin
+    results stream and refreshed analyses to symbol subscribers.
+    """
+    if not data:
+        return
+    broadcaster.publish(RESULTS_TOPIC, "results", {"source": source, "data": data})
+    await publish_analysis(list(data.keys()))
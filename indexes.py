@@ -0,0 +1,222 @@
+import os
+import re
+import logging
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# --- RETENTION ---
+# Log collections are capped in time with TTL indexes on "timestamp".
+# 0 keeps documents forever (a plain index still backs the sort).
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_COLLECTIONS = ["logs", "td_logs", "apewisdom_logs"]
+# Leaderboard snapshots: only the latest is read, older ones are history.
+SNAPSHOT_RETENTION_DAYS = int(os.getenv("SNAPSHOT_RETENTION_DAYS", "7"))
+SNAPSHOT_COLLECTIONS = ["apewisdom_leaderboard"]
+
+
+def retention_seconds(collection: str):
+    """
+    Retention for a log or snapshot collection, overridable per collection
+    with e.g. RETENTION_DAYS_TD_LOGS=90.
+    """
+    default = SNAPSHOT_RETENTION_DAYS if collection in SNAPSHOT_COLLECTIONS else LOG_RETENTION_DAYS
+    days = int(os.getenv(f"RETENTION_DAYS_{collection.upper()}", default))
+    return days * 86400 if days > 0 else None
+
+
+# --- DECLARATIVE SPEC ---
+# Each entry targets either a fixed "collection" or every collection whose
+# name matches "pattern" (per-symbol families such as td_prices_AAPL).
+# "keys" is the index key list; "options" is passed to create_index.
+INDEX_SPECS = [
+    {
+        "collection": "users",
+        "keys": [("username", ASCENDING)],
+        "options": {"name": "username_unique", "unique": True},
+    },
+    {
+        # Latest bars by date, ties (re-fetched bars) resolved by insertion order.
+        # Also backs the backfill's upserts by datetime (td_prices_AAPL_1h).
+        "pattern": r"^td_prices_[A-Z0-9.\-]+(_[0-9a-z]+)?$",
+        "keys": [("datetime", DESCENDING), ("_id", DESCENDING)],
+        "options": {"name": "datetime_desc_id_desc"},
+    },
+    {
+        # Per-ticker ApeWisdom snapshots (apewisdom_AAPL, not apewisdom_logs)
+        "pattern": r"^apewisdom_[A-Z0-9.\-]+$",
+        "keys": [("timestamp", DESCENDING), ("_id", DESCENDING)],
+        "options": {"name": "timestamp_desc_id_desc"},
+    },
+    {
+        # Weekly/monthly aggregates; $merge upserts on (resolution, bucket)
+        "pattern": r"^(td|aw)_rollup_[A-Z0-9.\-]+$",
+        "keys": [("resolution", ASCENDING), ("bucket", ASCENDING)],
+        "options": {"name": "resolution_bucket_unique", "unique": True},
+    },
+    {
+        # Latest leaderboard snapshot for the trending endpoint; also
+        # expires old snapshots (a single-field TTL index works either way)
+        "collection": "apewisdom_leaderboard",
+        "keys": [("timestamp", DESCENDING)],
+        "options": {"name": "timestamp_desc"},
+        "ttl": "apewisdom_leaderboard",
+    },
+    {
+        # Application log triage (logs_query): newest first, optionally
+        # narrowed by level or logger, keyset-paginated on (timestamp, _id)
+        "collection": "logs",
+        "keys": [("timestamp", DESCENDING), ("_id", DESCENDING)],
+        "options": {"name": "timestamp_desc_id_desc"},
+    },
+    {
+        "collection": "logs",
+        "keys": [("level", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+        "options": {"name": "level_timestamp_desc_id_desc"},
+    },
+    {
+        "collection": "logs",
+        "keys": [("logger", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+        "options": {"name": "logger_timestamp_desc_id_desc"},
+    },
+    {
+        # Active universe in symbol order (paging, ETL batching)
+        "collection": "watchlist",
+        "keys": [("active", ASCENDING), ("_id", ASCENDING)],
+        "options": {"name": "active_id"},
+    },
+] + [
+    {
+        "collection": name,
+        "keys": [("timestamp", ASCENDING)],
+        "options": {"name": "timestamp_ttl"},
+        "ttl": name,
+    }
+    for name in LOG_COLLECTIONS
+]
+
+
+def _targets(spec, collection_names):
+    if "collection" in spec:
+        return [spec["collection"]]
+    pattern = re.compile(spec["pattern"])
+    return [name for name in collection_names if pattern.match(name)]
+
+
+def _specs_for(collection: str):
+    return [spec for spec in INDEX_SPECS if collection in _targets(spec, [collection])]
+
+
+def _spec_options(spec):
+    options = dict(spec["options"])
+    if "ttl" in spec:
+        seconds = retention_seconds(spec["ttl"])
+        if seconds is not None:
+            options["expireAfterSeconds"] = seconds
+    return options
+
+
+async def _ensure_spec(db, collection: str, spec, existing: dict):
+    keys = spec["keys"]
+    options = _spec_options(spec)
+    current = next((info for info in existing.values() if info["key"] == keys), None)
+    coll = db[collection]
+
+    if current is None:
+        await coll.create_index(keys, **options)
+        logger.info(f"Created index {options['name']} on {collection}")
+        return
+
+    wanted_ttl = options.get("expireAfterSeconds")
+    current_ttl = current.get("expireAfterSeconds")
+    if wanted_ttl == current_ttl:
+        return
+
+    if wanted_ttl is not None and current_ttl is not None:
+        # Retention changed: adjust in place, no rebuild needed
+        await db.command(
+            "collMod", collection,
+            index={"keyPattern": dict(keys), "expireAfterSeconds": wanted_ttl}
+        )
+    else:
+        # TTL switched on or off: rebuild the index with the new options
+        name = next(n for n, info in existing.items() if info is current)
+        await coll.drop_index(name)
+        await coll.create_index(keys, **options)
+    logger.info(f"Updated retention on {collection} to {wanted_ttl} seconds")
+
+
+# Collections already checked by this process, so ETL runs can call
+# ensure_collection_indexes() on every insert at no cost.
+_ensured = set()
+
+
+async def ensure_collection_indexes(db, collection: str):
+    """
+    Apply every spec that targets one collection. Used by the ETLs when a
+    new per-symbol collection appears after startup.
+    """
+    if collection in _ensured:
+        return
+    specs = _specs_for(collection)
+    if specs:
+        existing = await db[collection].index_information()
+        for spec in specs:
+            await _ensure_spec(db, collection, spec, existing)
+    _ensured.add(collection)
+
+
+async def ensure_indexes(db):
+    """
+    Apply the whole spec: fixed collections plus every existing member of
+    each dynamic family. Idempotent, safe to run on every startup.
+    """
+    collection_names = await db.list_collection_names()
+    targets = set()
+    for spec in INDEX_SPECS:
+        targets.update(_targets(spec, collection_names))
+    for collection in sorted(targets):
+        _ensured.discard(collection)
+        try:
+            await ensure_collection_indexes(db, collection)
+        except OperationFailure as exc:
+            logger.error(f"Index maintenance failed on {collection}: {exc}")
+    logger.info(f"Indexes ensured on {len(targets)} collections")
+
+
+async def index_report(db):
+    """
+    Compare the spec with what exists on the server.
+    - missing: declared indexes that do not exist
+    - unused: existing indexes with zero accesses since the server started
+    - undeclared: existing indexes that the spec does not know about
+    """
+    collection_names = await db.list_collection_names()
+    report = {}
+    for collection in sorted(collection_names):
+        specs = _specs_for(collection)
+        if not specs:
+            continue
+        existing = await db[collection].index_information()
+        existing_keys = {name: info["key"] for name, info in existing.items()}
+        declared_keys = [spec["keys"] for spec in specs]
+
+        usage = {}
+        try:
+            async for stat in db[collection].aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat["accesses"]["ops"]
+        except OperationFailure:
+            # $indexStats is not available on every deployment tier
+            pass
+
+        report[collection] = {
+            "missing": [spec["options"]["name"] for spec in specs if spec["keys"] not in existing_keys.values()],
+            "unused": [name for name, ops in usage.items() if ops == 0 and name != "_id_"],
+            "undeclared": [
+                name for name, keys in existing_keys.items()
+                if name != "_id_" and keys not in declared_keys
+            ],
+            "usage": usage,
+        }
+    return report
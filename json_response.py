@@ -0,0 +1,72 @@
+import os
+from typing import Any
+
+import numpy as np
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+
+# --- CONFIGURATION ---
+# Responses larger than this many bytes are gzip-compressed when the client
+# sends "Accept-Encoding: gzip". Set it to 0 to disable compression.
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+
+# orjson serializes datetime, date, UUID and numpy arrays/scalars natively.
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def default(obj: Any):
+    """
+    Fallback for the types orjson does not know about.
+    Only called for values orjson cannot encode itself, so the common
+    path (str, float, datetime, numpy) never reaches Python code.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        # pandas.Timestamp and similar datetime-likes
+        return obj.isoformat()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=default, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse backed by orjson that encodes raw MongoDB documents
+    (ObjectId, datetime) and numpy values without a conversion pass.
+
+    Return it directly from an endpoint to skip FastAPI's jsonable_encoder,
+    which otherwise walks the whole payload in Python before rendering.
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class SelectiveGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves streaming endpoints alone: compressing
+    Server-Sent Events would buffer them until the gzip block fills.
+    """
+    excluded_prefixes = ("/stream/",)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.excluded_prefixes):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+def add_compression(app):
+    """
+    Compress large payloads (price series, results) when the client allows it.
+    """
+    if GZIP_MINIMUM_SIZE > 0:
+        app.add_middleware(SelectiveGZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
@@ -0,0 +1,103 @@
+import base64
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# --- CONFIGURATION ---
+LOGS_COLLECTION = "logs"
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+BUCKET_UNITS = ["minute", "hour", "day"]
+# Histograms without a start only look this far back
+DEFAULT_HISTOGRAM_WINDOW = timedelta(hours=24)
+# Newest first; _id breaks ties between records logged in the same millisecond.
+# Every query below is answered from one of the logs indexes in INDEX_SPECS.
+SORT = [("timestamp", -1), ("_id", -1)]
+
+
+class InvalidCursorError(ValueError):
+    """
+    The pagination cursor was not produced by query_logs.
+    """
+
+
+def encode_cursor(doc: dict):
+    raw = f"{doc['timestamp'].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), ObjectId(oid)
+    except (ValueError, InvalidId) as exc:
+        raise InvalidCursorError("Invalid cursor") from exc
+
+
+def build_filter(levels: list[str] = None, logger_name: str = None,
+                 start: datetime = None, end: datetime = None):
+    query = {}
+    if levels:
+        query["level"] = levels[0] if len(levels) == 1 else {"$in": levels}
+    if logger_name:
+        query["logger"] = logger_name
+    if start or end:
+        query["timestamp"] = {}
+        if start:
+            query["timestamp"]["$gte"] = start
+        if end:
+            query["timestamp"]["$lt"] = end
+    return query
+
+
+async def query_logs(db, levels: list[str] = None, logger_name: str = None,
+                     start: datetime = None, end: datetime = None,
+                     cursor: str = None, limit: int = 100):
+    """
+    One page of log records, newest first. Pass the returned next_cursor
+    to get the following page: keyset pagination, so page 1000 costs the
+    same as page 1 (no skip).
+    """
+    query = build_filter(levels, logger_name, start, end)
+    if cursor:
+        timestamp, oid = decode_cursor(cursor)
+        keyset = {"$or": [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": oid}},
+        ]}
+        query = {"$and": [query, keyset]} if query else keyset
+
+    # One extra document tells whether another page exists
+    docs = await db[LOGS_COLLECTION].find(query).sort(SORT).limit(limit + 1).to_list(length=limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    return {
+        "entries": docs,
+        "next_cursor": encode_cursor(docs[-1]) if has_more else None,
+    }
+
+
+async def histogram(db, unit: str = "hour", bin_size: int = 1, levels: list[str] = None,
+                    logger_name: str = None, start: datetime = None, end: datetime = None):
+    """
+    Record counts per level per time bucket, computed on the server.
+    Returns buckets oldest first as {"bucket", "counts": {level: n}, "total"}.
+    """
+    start = start or datetime.utcnow() - DEFAULT_HISTOGRAM_WINDOW
+    pipeline = [
+        {"$match": build_filter(levels, logger_name, start, end)},
+        {"$group": {
+            "_id": {
+                "bucket": {"$dateTrunc": {"date": "$timestamp", "unit": unit, "binSize": bin_size}},
+                "level": "$level",
+            },
+            "count": {"$sum": 1},
+        }},
+        {"$group": {
+            "_id": "$_id.bucket",
+            "counts": {"$push": {"k": "$_id.level", "v": "$count"}},
+            "total": {"$sum": "$count"},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "bucket": "$_id", "counts": {"$arrayToObject": "$counts"}, "total": 1}},
+    ]
+    return await db[LOGS_COLLECTION].aggregate(pipeline).to_list(length=None)
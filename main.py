@@ -1,21 +1,25 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from datetime import timedelta
-from motor.motor_asyncio import AsyncIOMotorClient
 from contextlib import asynccontextmanager
-import models, schemas, auth, database
+import models, schemas, auth, database, indexes, rollups, etl_lock, events, watchlist, upstream, trending, logs_query, backtest
 from logging_config import setup_logging
 from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import asyncio
 import logging
-import certifi
 import twelvedata_etl
+import downsample
 import os
 from datetime import datetime
+from typing import Optional
 import apewisdom_etl
 from analysis_etl import analyze_symbol
+from json_response import FastJSONResponse, add_compression
 # LIFECYCLE EVENTS
 
 @asynccontextmanager
@@ -24,30 +28,30 @@ async def lifespan(app: FastAPI):
     setup_logging()
     logger = logging.getLogger(__name__)
     logger.info("Starting up: Connecting to MongoDB...")
-    database.db_manager.client = AsyncIOMotorClient(
-        database.MONGO_URL,
-        tls=True,
-        tlsCAFile=certifi.where()
-    )
-    database.db_manager.db = database.db_manager.client[database.DB_NAME]
+    await database.db_manager.connect()
     
-    # Create unique index for username to ensure no duplicates
-    await database.db_manager.db["users"].create_index("username", unique=True)
-    logger.info("MongoDB connected and index created.")
+    # Declared indexes (unique usernames, sort/range support, log TTLs)
+    await indexes.ensure_indexes(database.db_manager.db)
+    logger.info("MongoDB connected and indexes ensured.")
     
+    # Backtest worker processes, shared by every /backtest request
+    backtest.get_pool()
+
     # The application runs while this yield is active
     yield
     
     # Shutdown Logic
-    if database.db_manager.client:
-        database.db_manager.client.close()
+    backtest.shutdown_pool()
+    await upstream.close()
+    await database.db_manager.close()
     logger.info("Shutting down: MongoDB connection closed.")
 
 app = FastAPI(
     title="Sample FastAPI auth project",
     description="Distributed System Node Registry with OAuth2 + MongoDB Atlas",
     version="2.0.1",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # CORS Configuration
@@ -63,6 +67,19 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Gzip large JSON payloads (price series, ETL results)
+add_compression(app)
+
+@app.exception_handler(etl_lock.LeaseHeldError)
+async def etl_already_running(request, exc: etl_lock.LeaseHeldError):
+    # Another worker in the cluster holds this ETL's lease
+    return FastJSONResponse(status_code=409, content={"detail": str(exc), "holder": exc.holder})
+
+@app.exception_handler(upstream.UpstreamError)
+async def upstream_unavailable(request, exc: upstream.UpstreamError):
+    # Provider down, throttling or circuit open: fail fast instead of hanging
+    return FastJSONResponse(status_code=503, content={"detail": str(exc)})
+
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # PUBLIC ROUTES
@@ -180,19 +197,10 @@ async def get_system_status(current_user: dict = Depends(auth.get_current_user))
 
 @app.get("/users", response_model=schemas.UserResponse)
 async def get_all_users(db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
-    users_cursor = db["users"].find({})
+    projection = {"full_name": 1, "username": 1, "email": 1, "role": 1, "is_active": 1}
+    users_cursor = db["users"].find({}, projection)
     users = await users_cursor.to_list(length=50)
-    filtered_users = [
-        {
-            "_id": str(user["_id"]),
-            "full_name": user["full_name"],
-            "username": user["username"],
-            "email": user["email"],
-            "role": user["role"],
-            "is_active": user["is_active"]
-        } for user in users
-    ]
-    return JSONResponse(content=filtered_users)
+    return FastJSONResponse(content=users)
 
 @app.get("/users/{user_id}")
 async def get_user(user_id: str, db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
@@ -259,6 +267,86 @@ async def update_user_role(user_id: str, payload: dict, db=Depends(database.get_
         "role": new_role
     })
 
+@app.post("/users/bulk", response_model=schemas.BulkUserResponse)
+async def bulk_update_users(payload: schemas.BulkUserRequest, db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
+    """
+    Apply many profile edits, role changes and soft deletes in a single
+    unordered bulk_write. Each operation gets its own result entry.
+    """
+    logger = logging.getLogger(__name__)
+    results = [None] * len(payload.operations)
+    pending = []  # (result index, user ObjectId, UpdateOne)
+    deletion_timestamp = datetime.now()
+
+    def result(index, status, detail=None):
+        item = payload.operations[index]
+        return {"index": index, "op": item.op, "user_id": item.user_id, "status": status, "detail": detail}
+
+    for index, item in enumerate(payload.operations):
+        try:
+            user_oid = ObjectId(item.user_id)
+        except Exception:
+            results[index] = result(index, "invalid", "Invalid user ID")
+            continue
+
+        if item.op == "update":
+            data_to_update = {k: v for k, v in {"full_name": item.full_name, "email": item.email}.items() if v is not None}
+            if not data_to_update:
+                results[index] = result(index, "invalid", "No valid fields to update")
+                continue
+        elif item.op == "role":
+            if not item.role:
+                results[index] = result(index, "invalid", "Missing role")
+                continue
+            data_to_update = {"role": item.role}
+        else:
+            data_to_update = {"is_active": False, "deleted_at": deletion_timestamp}
+
+        pending.append((index, user_oid, UpdateOne({"_id": user_oid}, {"$set": data_to_update})))
+
+    # One round trip to find which targets exist, so missing users are
+    # reported per item instead of silently matching nothing
+    target_ids = list({user_oid for _, user_oid, _ in pending})
+    existing = set()
+    if target_ids:
+        async for doc in db["users"].find({"_id": {"$in": target_ids}}, {"_id": 1}):
+            existing.add(doc["_id"])
+
+    writes = []
+    for index, user_oid, request in pending:
+        if user_oid not in existing:
+            results[index] = result(index, "not_found", "User not found")
+            continue
+        results[index] = result(index, "ok")
+        writes.append((index, request))
+
+    matched = modified = 0
+    if writes:
+        try:
+            outcome = await db["users"].bulk_write([request for _, request in writes], ordered=False)
+            matched, modified = outcome.matched_count, outcome.modified_count
+        except BulkWriteError as exc:
+            details = exc.details
+            matched, modified = details.get("nMatched", 0), details.get("nModified", 0)
+            for error in details.get("writeErrors", []):
+                index = writes[error["index"]][0]
+                results[index]["status"] = "error"
+                results[index]["detail"] = error.get("errmsg")
+
+        # Open admin dashboards reload their user table
+        events.broadcaster.publish(events.USERS_TOPIC, "users", {
+            "user_ids": sorted({payload.operations[index].user_id for index, _ in writes})
+        }, retain=False)
+
+    logger.info(f"Bulk user operation: {len(payload.operations)} requested, {matched} matched, {modified} modified")
+    return {
+        "code": 200,
+        "message": "Bulk operation completed",
+        "matched": matched,
+        "modified": modified,
+        "results": results
+    }
+
 @app.delete("/users/{user_id}")
 async def delete_user(user_id: str, db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
     try:
@@ -280,6 +368,86 @@ async def delete_user(user_id: str, db=Depends(database.get_db), current_user: d
         "deleted_at": deletion_timestamp.isoformat()
     }
 
+@app.get("/health")
+async def health():
+    """
+    Liveness/readiness probe: MongoDB ping latency and pool statistics.
+    """
+    timeout = database.MONGO_HEALTH_TIMEOUT_S
+    try:
+        await asyncio.wait_for(database.get_db(), timeout)
+        latency_ms = await database.db_manager.ping(timeout)
+    except Exception as exc:
+        # The driver's message names the cluster hosts: log it, don't return it
+        logging.getLogger(__name__).error(f"Health check failed: {exc!r}")
+        return FastJSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "error": "database unreachable", "pool": database.db_manager.pool_stats.snapshot()}
+        )
+    return {
+        "status": "ok",
+        "mongo_ping_ms": latency_ms,
+        "pool": database.db_manager.pool_stats.snapshot()
+    }
+
+@app.get("/upstream/metrics")
+async def get_upstream_metrics(current_user: dict = Depends(auth.get_current_user)):
+    """
+    Per-provider request, retry and throttling counters plus breaker state.
+    """
+    return upstream.metrics()
+
+@app.get("/admin/indexes")
+async def get_index_report(db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
+    """
+    Missing, unused and undeclared indexes per collection.
+    """
+    return await indexes.index_report(db)
+
+@app.post("/admin/indexes/apply")
+async def apply_indexes(db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
+    await indexes.ensure_indexes(db)
+    return await indexes.index_report(db)
+
+def _validate_levels(level: Optional[list[str]]):
+    levels = [value.upper() for value in level or []]
+    invalid = [value for value in levels if value not in logs_query.LEVELS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid level: {', '.join(invalid)}")
+    return levels
+
+@app.get("/admin/logs")
+async def get_logs(level: Optional[list[str]] = Query(None), logger: Optional[str] = None,
+                   start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   cursor: Optional[str] = None, limit: int = Query(100, ge=1, le=1000),
+                   db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
+    """
+    Application logs, newest first, filtered by level (repeatable), logger
+    and time range. Follow next_cursor for older pages.
+    """
+    try:
+        page = await logs_query.query_logs(
+            db, _validate_levels(level), logger, start, end, cursor=cursor, limit=limit
+        )
+    except logs_query.InvalidCursorError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse(page)
+
+@app.get("/admin/logs/histogram")
+async def get_logs_histogram(unit: str = "hour", bin_size: int = Query(1, ge=1),
+                             level: Optional[list[str]] = Query(None), logger: Optional[str] = None,
+                             start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             db=Depends(database.get_db), current_user: dict = Depends(auth.get_current_user)):
+    """
+    Log counts per level per time bucket (last 24 hours unless start is given).
+    """
+    if unit not in logs_query.BUCKET_UNITS:
+        raise HTTPException(status_code=400, detail=f"'unit' must be one of {', '.join(logs_query.BUCKET_UNITS)}")
+    buckets = await logs_query.histogram(
+        db, unit, bin_size, _validate_levels(level), logger, start, end
+    )
+    return FastJSONResponse({"unit": unit, "bin_size": bin_size, "buckets": buckets})
+
 @app.get("/admin")
 async def load_admin():
     file_path = os.path.join("static", "admin.html")
@@ -307,6 +475,28 @@ async def read_root():
         print("ERROR: File not found")
         return "<h1>Error: index.html not found. Please ensure it is in the same directory as main.py.</h1>"
 
+# Watchlist (symbol universe shared by both ETLs)
+@app.get("/watchlist")
+async def get_watchlist(page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=500),
+                        current_user: dict = Depends(auth.get_current_user)):
+    total, symbols = await watchlist.page_symbols(page, page_size)
+    return {"total": total, "page": page, "page_size": page_size, "symbols": symbols}
+
+@app.post("/watchlist")
+async def add_to_watchlist(payload: schemas.WatchlistUpdate, current_user: dict = Depends(auth.get_current_user)):
+    symbols = [watchlist.normalize_symbol(symbol) for symbol in payload.symbols]
+    invalid = [raw for raw, symbol in zip(payload.symbols, symbols) if symbol is None]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid symbols: {', '.join(invalid)}")
+    added = await watchlist.add_symbols(symbols)
+    return {"code": 200, "message": f"{added} symbols added to the watchlist"}
+
+@app.delete("/watchlist/{symbol}")
+async def remove_from_watchlist(symbol: str, current_user: dict = Depends(auth.get_current_user)):
+    if not await watchlist.remove_symbol(symbol.upper()):
+        raise HTTPException(status_code=404, detail="Symbol not in watchlist")
+    return {"code": 200, "message": f"{symbol.upper()} removed from the watchlist"}
+
 # TwelveData ETL
 @app.post("/etl/twelvedata/run")
 async def run_twelvedata():
@@ -314,12 +504,12 @@ async def run_twelvedata():
     return len(results)
 
 @app.get("/etl/twelvedata/results")
-async def get_twelvedata_results():
-    return await twelvedata_etl.get_last_results()
+async def get_twelvedata_results(page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=500)):
+    return FastJSONResponse(await twelvedata_etl.get_last_results(page, page_size))
 
 @app.get("/etl/twelvedata/history")
 async def get_twelvedata_history():
-    return await twelvedata_etl.get_history()
+    return FastJSONResponse(await twelvedata_etl.get_history())
 
 # ApeWisdom ETL
 @app.post("/etl/apewisdom/run")
@@ -328,14 +518,116 @@ async def run_apewisdom_etl():
     return len(results)
 
 @app.get("/etl/apewisdom/results")
-async def get_apewisdom_results():
-    return await apewisdom_etl.get_last_results()
+async def get_apewisdom_results(page: int = Query(1, ge=1), page_size: int = Query(50, ge=1, le=500)):
+    return FastJSONResponse(await apewisdom_etl.get_last_results(page=page, page_size=page_size))
+
+@app.get("/apewisdom/trending")
+async def get_trending(k: int = Query(20, ge=1, le=500), by: str = "composite",
+                       min_mentions: float = Query(0, ge=0), db=Depends(database.get_db)):
+    """
+    Top-k movers of the latest leaderboard snapshot by mention growth,
+    rank velocity, upvote ratio or the composite of the three.
+    """
+    if by not in trending.SCORES:
+        raise HTTPException(status_code=400, detail=f"'by' must be one of {', '.join(trending.SCORES)}")
+    latest = await trending.latest_scores(db)
+    if latest is None:
+        raise HTTPException(status_code=404, detail="No leaderboard snapshot yet, run the ApeWisdom ETL")
+    return FastJSONResponse({
+        "snapshot_timestamp": latest["timestamp"],
+        "tickers_scored": len(latest["scored"][0]),
+        "by": by,
+        "movers": trending.top_movers(latest["scored"], k=k, by=by, min_mentions=min_mentions)
+    })
 
 @app.get("/etl/apewisdom/history")
 async def get_apewisdom_history():
-    return await apewisdom_etl.get_history()
+    return FastJSONResponse(await apewisdom_etl.get_history())
+
+@app.post("/etl/rollups/run")
+async def run_rollups():
+    """
+    Recompute weekly/monthly rollups from the full raw history.
+    """
+    return await rollups.run_rollups(await watchlist.get_symbols())
+
+@app.post("/backtest")
+async def run_backtest(payload: schemas.BacktestRequest, current_user: dict = Depends(auth.get_current_user)):
+    """
+    Sweep price-trend x mention-threshold strategies over the stored history
+    and rank the parameter sets by average total return.
+    """
+    symbols = None
+    if payload.symbols:
+        symbols = [watchlist.normalize_symbol(symbol) for symbol in payload.symbols]
+        invalid = [raw for raw, symbol in zip(payload.symbols, symbols) if symbol is None]
+        if invalid:
+            raise HTTPException(status_code=400, detail=f"Invalid symbols: {', '.join(invalid)}")
+    try:
+        report = await backtest.run_backtest(
+            symbols, payload.lookbacks, payload.price_thresholds, payload.mention_thresholds, top=payload.top
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return FastJSONResponse(report)
 
 @app.get("/analyze/{symbol}")
-async def analyze(symbol: str):
-    result = await analyze_symbol(symbol)
-    return result
\ No newline at end of file
+async def analyze(symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  max_points: Optional[int] = Query(None, ge=downsample.MIN_POINTS, le=downsample.MAX_POINTS)):
+    result = await analyze_symbol(symbol, start=start, end=end, max_points=max_points)
+    return FastJSONResponse(result)
+
+# Server-Sent Events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.get("/stream/analyze/{symbol}")
+async def stream_analysis(symbol: str, request: Request,
+                          max_points: Optional[int] = Query(None, ge=downsample.MIN_POINTS, le=downsample.MAX_POINTS),
+                          current_user: dict = Depends(auth.get_current_user_from_query)):
+    """
+    Pushes a fresh analysis of the symbol every time an ETL run updates it.
+    The current analysis is sent on connect. Chart series are downsampled
+    to max_points, as in /analyze.
+    """
+    symbol = symbol.upper()
+    topic = events.analysis_topic(symbol, max_points)
+    initial = None
+    if events.broadcaster.last(topic) is None:
+        initial = ("analysis", await analyze_symbol(symbol, max_points=max_points))
+    return StreamingResponse(events.stream(request, topic, initial), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/stream/results")
+async def stream_results(request: Request, current_user: dict = Depends(auth.get_current_user_from_query)):
+    """
+    Pushes the records inserted by each ETL run (results deltas).
+    """
+    return StreamingResponse(events.stream(request, events.RESULTS_TOPIC), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/stream/users")
+async def stream_users(request: Request, current_user: dict = Depends(auth.get_current_user_from_query)):
+    """
+    Notifies admin dashboards when users change through bulk administration.
+    """
+    return StreamingResponse(events.stream(request, events.USERS_TOPIC), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/export/{symbol}")
+async def export_symbol(symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                        resolution: Optional[str] = None,
+                        max_points: Optional[int] = Query(None, ge=downsample.MIN_POINTS, le=downsample.MAX_POINTS),
+                        db=Depends(database.get_db)):
+    """
+    Price and mention history for a range. Long ranges are served from the
+    weekly/monthly rollups unless a resolution ("raw", "week", "month") is forced.
+    With max_points each series is downsampled (LTTB) to at most that many rows.
+    """
+    if resolution is not None and resolution not in ["raw", *rollups.RESOLUTIONS]:
+        raise HTTPException(status_code=400, detail="Invalid resolution")
+    start, end = rollups.to_naive_utc(start), rollups.to_naive_utc(end)
+    resolution, prices = await rollups.load_price_series(db, symbol, start, end, resolution)
+    _, mentions = await rollups.load_mention_series(db, symbol, start, end, resolution)
+    return FastJSONResponse({
+        "symbol": symbol,
+        "resolution": resolution,
+        "prices": downsample.downsample_rows(prices, "datetime", "close", max_points),
+        "mentions": downsample.downsample_rows(mentions, "timestamp", "mentions", max_points)
+    })
\ No newline at end of file
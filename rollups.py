@@ -0,0 +1,297 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from database import get_db
+from indexes import ensure_collection_indexes
+import columnar_store
+
+logger = logging.getLogger(__name__)
+
+# Rollup resolutions, finest to coarsest. Each maps to a $dateTrunc unit.
+RESOLUTIONS = ["week", "month"]
+# A resolution is good enough for a range when it still yields at least this
+# many points; the coarsest one that does is used.
+ROLLUP_MIN_POINTS = int(os.getenv("ROLLUP_MIN_POINTS", "60"))
+APPROX_DAYS = {"week": 7, "month": 30}
+
+
+def price_rollup_collection(symbol: str):
+    return f"td_rollup_{symbol}"
+
+
+def mention_rollup_collection(symbol: str):
+    return f"aw_rollup_{symbol}"
+
+
+def _to_double(field: str):
+    # TwelveData returns prices as strings; ApeWisdom counts may be missing
+    return {"$convert": {"input": f"${field}", "to": "double", "onError": None, "onNull": None}}
+
+
+def _bucket(date_expr, unit: str):
+    trunc = {"date": date_expr, "unit": unit}
+    if unit == "week":
+        trunc["startOfWeek"] = "monday"
+    return {"$dateTrunc": trunc}
+
+
+def _floor(since: datetime, unit: str):
+    """
+    Start of the bucket containing `since`, so an incremental rollup
+    recomputes whole buckets only.
+    """
+    day = since.replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+    if unit == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def _merge(into: str):
+    return {
+        "$merge": {
+            "into": into,
+            "on": ["resolution", "bucket"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }
+    }
+
+
+async def rollup_prices(db, symbol: str, since: datetime = None):
+    """
+    Roll td_prices_{symbol} bars into weekly and monthly OHLC documents.
+    Bars fetched more than once are collapsed to the latest insert first.
+    """
+    target = price_rollup_collection(symbol)
+    await ensure_collection_indexes(db, target)
+
+    for unit in RESOLUTIONS:
+        pipeline = []
+        if since is not None:
+            pipeline.append({"$match": {"datetime": {"$gte": _floor(since, unit)}}})
+        pipeline += [
+            {"$sort": {"datetime": 1, "_id": 1}},
+            {"$group": {"_id": "$datetime", "close": {"$last": _to_double("close")}}},
+            {"$match": {"close": {"$ne": None}}},
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": _bucket("$_id", unit),
+                "open": {"$first": "$close"},
+                "high": {"$max": "$close"},
+                "low": {"$min": "$close"},
+                "close": {"$last": "$close"},
+                "bars": {"$sum": 1},
+                "last_bar": {"$max": "$_id"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "resolution": unit,
+                "bucket": "$_id",
+                "open": 1, "high": 1, "low": 1, "close": 1,
+                "bars": 1, "last_bar": 1,
+            }},
+            _merge(target),
+        ]
+        await db[f"td_prices_{symbol}"].aggregate(pipeline).to_list(length=None)
+
+    logger.info(f"Rolled up prices for {symbol} into {target}")
+
+
+async def rollup_mentions(db, symbol: str, since: datetime = None):
+    """
+    Roll apewisdom_{symbol} snapshots into weekly and monthly mention
+    aggregates. Snapshots stored before they carried a timestamp fall back
+    to the ObjectId creation time.
+    """
+    target = mention_rollup_collection(symbol)
+    await ensure_collection_indexes(db, target)
+    taken_at = {"$ifNull": ["$timestamp", {"$toDate": "$_id"}]}
+
+    for unit in RESOLUTIONS:
+        pipeline = []
+        if since is not None:
+            # Match on stored fields first so the timestamp (or _id) index
+            # bounds the scan to the touched buckets
+            floor = _floor(since, unit)
+            pipeline.append({"$match": {"$or": [
+                {"timestamp": {"$gte": floor}},
+                {"timestamp": None, "_id": {"$gte": ObjectId.from_datetime(floor)}},
+            ]}})
+        pipeline += [
+            {"$addFields": {"_taken_at": taken_at}},
+            {"$sort": {"_taken_at": 1}},
+            {"$group": {
+                "_id": _bucket("$_taken_at", unit),
+                "mentions": {"$last": _to_double("mentions")},
+                "mentions_avg": {"$avg": _to_double("mentions")},
+                "mentions_max": {"$max": _to_double("mentions")},
+                "upvotes_avg": {"$avg": _to_double("upvotes")},
+                "best_rank": {"$min": _to_double("rank")},
+                "snapshots": {"$sum": 1},
+                "last_snapshot": {"$max": "$_taken_at"},
+            }},
+            {"$project": {
+                "_id": 0,
+                "resolution": unit,
+                "bucket": "$_id",
+                "mentions": 1, "mentions_avg": 1, "mentions_max": 1,
+                "upvotes_avg": 1, "best_rank": 1,
+                "snapshots": 1, "last_snapshot": 1,
+            }},
+            _merge(target),
+        ]
+        await db[f"apewisdom_{symbol}"].aggregate(pipeline).to_list(length=None)
+
+    logger.info(f"Rolled up mentions for {symbol} into {target}")
+
+
+async def run_rollups(symbols: list[str]):
+    """
+    Full recompute for every symbol, e.g. after a backfill.
+    """
+    db = await get_db()
+    for symbol in symbols:
+        await rollup_prices(db, symbol)
+        await rollup_mentions(db, symbol)
+    return len(symbols)
+
+
+def to_naive_utc(value: datetime = None):
+    """
+    MongoDB stores naive UTC datetimes; query parameters may carry a
+    timezone ("...Z"). Normalize once where a range enters the app.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def pick_resolution(start: datetime, end: datetime):
+    """
+    Coarsest resolution that still gives ROLLUP_MIN_POINTS over the range,
+    or "raw" when the range is too short for any rollup.
+    """
+    if start is None or end is None:
+        return "raw"
+    span_days = (end - start).total_seconds() / 86400
+    for unit in reversed(RESOLUTIONS):
+        if span_days / APPROX_DAYS[unit] >= ROLLUP_MIN_POINTS:
+            return unit
+    return "raw"
+
+
+def _range(field: str, start: datetime, end: datetime):
+    bounds = {}
+    if start is not None:
+        bounds["$gte"] = start
+    if end is not None:
+        bounds["$lte"] = end
+    return {field: bounds} if bounds else {}
+
+
+def _cached_rows(columns: dict, names: dict):
+    """
+    Rows from columnar_store arrays; names maps row keys to columns.
+    NaN (missing in MongoDB) becomes None, as in the raw readers.
+    """
+    values = [columns[column].tolist() for column in names.values()]
+    return [
+        {key: (None if value != value else value) for key, value in zip(names, row)}
+        for row in zip(*values)
+    ]
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+async def load_price_series(db, symbol: str, start: datetime = None, end: datetime = None, resolution: str = None):
+    """
+    Oldest-first [{"datetime", "close"}] for the range, read from the
+    coarsest collection that satisfies it. Returns (resolution, rows).
+    """
+    resolution = resolution or pick_resolution(start, end or datetime.utcnow())
+
+    if resolution == "raw":
+        cached = await columnar_store.load_fresh(db, symbol, "prices", start, end)
+        if cached is not None:
+            return resolution, _cached_rows(cached, {"datetime": "time", "close": "close"})
+        cursor = (
+            db[f"td_prices_{symbol}"]
+            .find(_range("datetime", start, end), {"datetime": 1, "close": 1})
+            .sort([("datetime", 1), ("_id", 1)])
+        )
+        # Later inserts of the same bar win
+        bars = {}
+        async for record in cursor:
+            close = _float(record.get("close"))
+            if close is not None:
+                bars[record["datetime"]] = close
+        return resolution, [{"datetime": dt, "close": close} for dt, close in bars.items()]
+
+    # Include the bucket that contains `start`
+    floor = _floor(start, resolution) if start is not None else None
+    query = {"resolution": resolution, **_range("bucket", floor, end)}
+    rows = await (
+        db[price_rollup_collection(symbol)]
+        .find(query, {"_id": 0, "resolution": 0})
+        .sort("bucket", 1)
+        .to_list(length=None)
+    )
+    if not rows:
+        # Rollups not built yet for this symbol: answer from raw history
+        return await load_price_series(db, symbol, start, end, resolution="raw")
+    for row in rows:
+        row["datetime"] = row.pop("bucket")
+    return resolution, rows
+
+
+async def load_mention_series(db, symbol: str, start: datetime = None, end: datetime = None, resolution: str = None):
+    """
+    Oldest-first [{"timestamp", "mentions"}] for the range, read from the
+    coarsest collection that satisfies it. Returns (resolution, rows).
+    """
+    resolution = resolution or pick_resolution(start, end or datetime.utcnow())
+
+    if resolution == "raw":
+        cached = await columnar_store.load_fresh(db, symbol, "mentions", start, end)
+        if cached is not None:
+            return resolution, _cached_rows(
+                cached, {"timestamp": "time", "mentions": "mentions", "upvotes": "upvotes", "rank": "rank"}
+            )
+        cursor = (
+            db[f"apewisdom_{symbol}"]
+            .find(_range("timestamp", start, end), {"timestamp": 1, "mentions": 1, "upvotes": 1, "rank": 1})
+            .sort([("timestamp", 1), ("_id", 1)])
+        )
+        rows = []
+        async for record in cursor:
+            mentions = _float(record.get("mentions"))
+            if mentions is not None:
+                rows.append({
+                    "timestamp": record.get("timestamp") or to_naive_utc(record["_id"].generation_time),
+                    "mentions": mentions,
+                    "upvotes": _float(record.get("upvotes")),
+                    "rank": _float(record.get("rank")),
+                })
+        return resolution, rows
+
+    # Include the bucket that contains `start`
+    floor = _floor(start, resolution) if start is not None else None
+    query = {"resolution": resolution, **_range("bucket", floor, end)}
+    rows = await (
+        db[mention_rollup_collection(symbol)]
+        .find(query, {"_id": 0, "resolution": 0})
+        .sort("bucket", 1)
+        .to_list(length=None)
+    )
+    if not rows:
+        # Rollups not built yet for this symbol: answer from raw history
+        return await load_mention_series(db, symbol, start, end, resolution="raw")
+    for row in rows:
+        row["timestamp"] = row.pop("bucket")
+    return resolution, rows
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, BeforeValidator, Field
-from typing import Optional, Annotated
+from typing import Optional, Annotated, Literal
 
 # --- ObjectId Helper ---
 # MongoDB uses ObjectIds, but JSON uses strings. This helper converts them.
@@ -55,4 +55,43 @@ class LogoutRequest(BaseModel):
 
 class LogoutResponse(BaseModel):
     code: int = 200
-    message: str = "Logout successful"
\ No newline at end of file
+    message: str = "Logout successful"
+
+# --- Bulk User Administration ---
+class BulkUserOperation(BaseModel):
+    # "update": full_name/email, "role": role, "delete": soft delete
+    op: Literal["update", "role", "delete"]
+    user_id: str
+    full_name: Optional[str] = None
+    email: Optional[str] = None
+    role: Optional[str] = None
+
+class BulkUserRequest(BaseModel):
+    operations: list[BulkUserOperation]
+
+class BulkUserResult(BaseModel):
+    index: int
+    op: str
+    user_id: str
+    status: Literal["ok", "invalid", "not_found", "error"]
+    detail: Optional[str] = None
+
+class BulkUserResponse(BaseModel):
+    code: int = 200
+    message: str = "Bulk operation completed"
+    matched: int
+    modified: int
+    results: list[BulkUserResult]
+
+# --- Watchlist Schemas ---
+class WatchlistUpdate(BaseModel):
+    symbols: list[str] = Field(min_length=1)
+
+# --- Backtesting ---
+class BacktestRequest(BaseModel):
+    # Omitted fields fall back to the watchlist / backtest.DEFAULT_* grids
+    symbols: Optional[list[str]] = None
+    lookbacks: Optional[list[Annotated[int, Field(ge=1)]]] = None
+    price_thresholds: Optional[list[float]] = None
+    mention_thresholds: Optional[list[float]] = None
+    top: int = Field(20, ge=1, le=500)
@@ -0,0 +1,99 @@
+import math
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+import downsample
+import rollups
+
+
+def reference_lttb(x, y, threshold):
+    """
+    Straightforward per-bucket LTTB (Steinarsson, 2013), returning indices.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        avg_start = math.floor((i + 1) * every) + 1
+        avg_end = min(math.floor((i + 2) * every) + 1, n)
+        avg_x = sum(x[avg_start:avg_end]) / (avg_end - avg_start)
+        avg_y = sum(y[avg_start:avg_end]) / (avg_end - avg_start)
+
+        max_area, chosen = -1.0, None
+        for j in range(math.floor(i * every) + 1, math.floor((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a])) * 0.5
+            if area > max_area:
+                max_area, chosen = area, j
+        kept.append(chosen)
+        a = chosen
+    kept.append(n - 1)
+    return kept
+
+
+@pytest.mark.parametrize("n, max_points", [(10, 4), (100, 7), (1000, 100), (5003, 500), (2000, 1999)])
+def test_matches_reference(n, max_points):
+    rng = np.random.default_rng(n)
+    x = np.cumsum(rng.uniform(0.5, 2.0, n))
+    y = np.cumsum(rng.normal(0, 1, n))
+    assert downsample.lttb_indices(x, y, max_points).tolist() == reference_lttb(x.tolist(), y.tolist(), max_points)
+
+
+def test_max_points_not_below_length_keeps_everything():
+    values = [3.0, 1.0, 4.0, 1.0, 5.0]
+    assert downsample.lttb_indices(range(5), values, 5).tolist() == [0, 1, 2, 3, 4]
+    assert downsample.lttb_indices(range(5), values, 50).tolist() == [0, 1, 2, 3, 4]
+    assert downsample.downsample_series(values, 5) is values
+    assert downsample.downsample_series(values, None) is values
+
+
+def test_three_points_keep_the_largest_triangle():
+    y = [0.0, 1.0, 9.0, 2.0, 0.5, 0.0]
+    x = list(range(len(y)))
+    # One bucket: its third vertex is the last point
+    areas = [abs((x[0] - x[-1]) * (y[j] - y[0]) - (x[0] - x[j]) * (y[-1] - y[0])) for j in range(1, len(y) - 1)]
+    assert downsample.lttb_indices(x, y, 3).tolist() == [0, 1 + int(np.argmax(areas)), len(y) - 1]
+
+
+def test_nan_values_are_never_chosen_over_real_points():
+    rng = np.random.default_rng(0)
+    y = rng.normal(0, 1, 200)
+    y[1::2] = np.nan
+    kept = downsample.lttb_indices(np.arange(200), y, 20)
+    assert len(kept) == 20
+    assert kept[0] == 0 and kept[-1] == 199
+    assert np.all(np.diff(kept) > 0)
+    assert not np.isnan(y[kept[1:-1]]).any()
+
+    # A gap wider than a bucket: only the empty buckets keep a NaN
+    y[60:100] = np.nan
+    kept = downsample.lttb_indices(np.arange(200), y, 20)
+    edges = np.linspace(1, 199, 19).astype(np.int64)
+    for b, index in enumerate(kept[1:-1]):
+        has_real = not np.isnan(y[edges[b]:edges[b + 1]]).all()
+        assert np.isnan(y[index]) != has_real
+
+
+def test_rows_mix_naive_and_aware_times(monkeypatch):
+    # A non-UTC local zone would shift naive datetime.timestamp() values
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        start = datetime(2024, 1, 1)
+        naive = [{"t": start + timedelta(hours=i), "v": math.sin(i / 5)} for i in range(300)]
+        # Legacy rows carry the aware ObjectId generation time
+        mixed = [
+            {"t": row["t"].replace(tzinfo=timezone.utc) if i % 3 == 0 else row["t"], "v": row["v"]}
+            for i, row in enumerate(naive)
+        ]
+        expected = [row["t"] for row in downsample.downsample_rows(naive, "t", "v", 30)]
+        result = [rollups.to_naive_utc(row["t"]) for row in downsample.downsample_rows(mixed, "t", "v", 30)]
+        assert result == expected
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -0,0 +1,88 @@
+import os
+import time
+import uuid
+import asyncio
+import multiprocessing
+from urllib.parse import urlparse
+
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+import etl_lock
+
+# Runs only against a local mongod, e.g.
+#   MONGODB_URI=mongodb://localhost:27017 python -m pytest tests/test_etl_lock.py
+MONGODB_URI = os.getenv("MONGODB_URI", "")
+LOCAL = urlparse(MONGODB_URI).scheme == "mongodb" and urlparse(MONGODB_URI).hostname in ("localhost", "127.0.0.1", "::1")
+pytestmark = pytest.mark.skipif(not LOCAL, reason="needs MONGODB_URI pointing at a local mongod")
+
+TTL = 1.0
+WORKERS = 4
+# Slack for the gap between the server's $$NOW and the worker's clock read
+SLACK = 0.25
+CRASH_EXIT_CODE = 3
+
+
+def _worker(uri: str, db_name: str, duration: float, crash: bool):
+    # Spawned process: records each hold in the "holds" collection, holding
+    # longer than the TTL so only heartbeat renewals keep others out
+    async def run():
+        client = AsyncIOMotorClient(uri)
+        db = client[db_name]
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            try:
+                async with etl_lock.Lease(db, "test", ttl=TTL) as held:
+                    hold = {"holder": held.holder, "token": held.fencing_token, "start": time.time()}
+                    await db["holds"].insert_one(hold)
+                    if crash:
+                        os._exit(CRASH_EXIT_CODE)
+                    await asyncio.sleep(TTL * 1.5)
+                    assert not held.lost
+                    await db["holds"].update_one({"_id": hold["_id"]}, {"$set": {"end": time.time()}})
+            except etl_lock.LeaseHeldError:
+                pass
+            await asyncio.sleep(0.05)
+        client.close()
+
+    asyncio.run(run())
+
+
+def test_lease_across_processes():
+    db_name = f"test_etl_lock_{uuid.uuid4().hex[:8]}"
+    client = MongoClient(MONGODB_URI)
+    context = multiprocessing.get_context("spawn")
+    crasher = context.Process(target=_worker, args=(MONGODB_URI, db_name, 10, True))
+    workers = [context.Process(target=_worker, args=(MONGODB_URI, db_name, 6 * TTL, False)) for _ in range(WORKERS)]
+    try:
+        # The first holder dies without releasing
+        crasher.start()
+        crasher.join(timeout=30)
+        assert crasher.exitcode == CRASH_EXIT_CODE
+
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+            assert worker.exitcode == 0
+
+        holds = list(client[db_name]["holds"].find().sort("start", 1))
+    finally:
+        for process in [crasher, *workers]:
+            if process.is_alive():
+                process.terminate()
+        client.drop_database(db_name)
+        client.close()
+
+    assert len(holds) >= 3
+    # Fencing tokens increase by one per acquisition, in acquisition order
+    assert [hold["token"] for hold in holds] == list(range(1, len(holds) + 1))
+    # Takeover only once the crashed holder's lease expired
+    crashed, survivors = holds[0], holds[1:]
+    assert "end" not in crashed
+    assert survivors[0]["start"] >= crashed["start"] + TTL - SLACK
+    # Mutual exclusion: each hold ends before the next one starts
+    for previous, current in zip(survivors, survivors[1:]):
+        assert previous["end"] <= current["start"]
+    assert len({hold["holder"] for hold in holds}) == len(holds)
@@ -0,0 +1,62 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+from fastapi.testclient import TestClient
+
+import analysis_etl
+import database
+import main
+import rollups
+
+
+def fake_series(calls):
+    async def load_price_series(db, symbol, start=None, end=None, resolution=None):
+        calls.append((start, end))
+        # Would raise TypeError on mixed naive/aware datetimes
+        return rollups.pick_resolution(start, end or datetime.utcnow()), []
+
+    async def load_mention_series(db, symbol, start=None, end=None, resolution=None):
+        return resolution, []
+
+    return load_price_series, load_mention_series
+
+
+def test_to_naive_utc():
+    aware = datetime(2020, 1, 1, 2, 0, tzinfo=timezone(timedelta(hours=2)))
+    assert rollups.to_naive_utc(aware) == datetime(2020, 1, 1, 0, 0)
+    assert rollups.to_naive_utc(datetime(2020, 1, 1)) == datetime(2020, 1, 1)
+    assert rollups.to_naive_utc(None) is None
+
+
+def test_analyze_symbol_accepts_aware_start(monkeypatch):
+    calls = []
+    prices, mentions = fake_series(calls)
+    monkeypatch.setattr(rollups, "load_price_series", prices)
+    monkeypatch.setattr(rollups, "load_mention_series", mentions)
+
+    async def get_db():
+        return None
+    monkeypatch.setattr(analysis_etl, "get_db", get_db)
+
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    result = asyncio.run(analysis_etl.analyze_symbol("AAPL", start=start, end=datetime(2020, 6, 1)))
+    assert result["td_count"] == 0
+    assert calls == [(datetime(2020, 1, 1), datetime(2020, 6, 1))]
+
+
+def test_export_accepts_aware_start(monkeypatch):
+    calls = []
+    prices, mentions = fake_series(calls)
+    monkeypatch.setattr(rollups, "load_price_series", prices)
+    monkeypatch.setattr(rollups, "load_mention_series", mentions)
+
+    async def get_db():
+        return None
+    main.app.dependency_overrides[database.get_db] = get_db
+    try:
+        response = TestClient(main.app).get("/export/AAPL?start=2020-01-01T00:00:00Z")
+    finally:
+        main.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert calls == [(datetime(2020, 1, 1), None)]
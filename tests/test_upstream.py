@@ -0,0 +1,175 @@
+import asyncio
+import time
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+import httpx
+import pytest
+
+import upstream
+
+
+class FakeClock:
+    """
+    Stands in for the time module inside upstream, so breaker timeouts and
+    HTTP dates can be tested without sleeping.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.wall = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.wall
+
+
+def make_provider(handler, **options):
+    # Fast bucket and no backoff: tests exercise the state machines, not delays
+    options = {"requests_per_minute": 600000, "base_delay": 0, "throttle_pause": 0, **options}
+    provider = upstream.Provider("test", **options)
+    provider._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return provider
+
+
+def test_breaker_closed_open_half_open(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream, "time", clock)
+    breaker = upstream.CircuitBreaker(failure_threshold=2, reset_timeout=10)
+
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    # After the reset timeout exactly one probe goes through
+    clock.now += 10
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+    # A failed probe reopens for another full timeout
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 9
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_cancelled_probe_frees_the_half_open_slot(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream, "time", clock)
+    started = asyncio.Event()
+
+    async def handler(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    provider = make_provider(handler, failure_threshold=1, reset_timeout=10)
+    provider.breaker.record_failure()
+    clock.now += 10
+
+    async def run():
+        probe = asyncio.create_task(provider.get_json("https://example.test/"))
+        await started.wait()
+        assert provider.breaker.probe_in_flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(run())
+    assert not provider.breaker.probe_in_flight
+    assert provider.breaker.allow()
+
+
+def test_retry_after_seconds(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(upstream, "time", clock)
+
+    def response(value=None):
+        headers = {"Retry-After": value} if value is not None else {}
+        return httpx.Response(429, headers=headers)
+
+    assert upstream.retry_after_seconds(response("5")) == 5.0
+    assert upstream.retry_after_seconds(response("-3")) == 0.0
+    date = format_datetime(datetime.fromtimestamp(clock.wall + 30, tz=timezone.utc), usegmt=True)
+    assert upstream.retry_after_seconds(response(date)) == pytest.approx(30)
+    past = format_datetime(datetime.fromtimestamp(clock.wall - 30, tz=timezone.utc), usegmt=True)
+    assert upstream.retry_after_seconds(response(past)) == 0.0
+    assert upstream.retry_after_seconds(response("soon")) is None
+    assert upstream.retry_after_seconds(response()) is None
+
+
+def test_token_bucket_waits_for_refill_and_pause():
+    async def run():
+        bucket = upstream.TokenBucket(rate=20, capacity=2)
+        assert await bucket.acquire() == 0
+        assert await bucket.acquire() == 0
+        # Empty: the next token takes 1 / rate seconds
+        assert await bucket.acquire() == pytest.approx(0.05, abs=0.02)
+
+        bucket.pause(0.1)
+        assert bucket.tokens == 0
+        assert await bucket.acquire() == pytest.approx(0.1, abs=0.02)
+
+    asyncio.run(run())
+
+
+def test_throttle_in_200_body_opens_breaker():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"code": 429, "message": "out of credits"})
+
+    provider = make_provider(
+        handler, max_attempts=2, failure_threshold=1,
+        is_throttled=lambda payload: payload.get("code") == 429,
+    )
+    with pytest.raises(upstream.UpstreamError):
+        asyncio.run(provider.get_json("https://example.test/"))
+
+    assert len(calls) == 2
+    assert provider.metrics["throttled"] == 2
+    assert provider.breaker.state == "open"
+    with pytest.raises(upstream.CircuitOpenError):
+        asyncio.run(provider.get_json("https://example.test/"))
+    assert len(calls) == 2
+    assert provider.metrics["short_circuited"] == 1
+
+
+def test_429_retry_after_pauses_bucket_then_succeeds():
+    responses = [
+        httpx.Response(429, headers={"Retry-After": "0.05"}),
+        httpx.Response(503),
+        httpx.Response(200, json={"ok": True}),
+    ]
+
+    def handler(request):
+        return responses.pop(0)
+
+    provider = make_provider(handler)
+    started = time.monotonic()
+    assert asyncio.run(provider.get_json("https://example.test/")) == {"ok": True}
+    assert time.monotonic() - started >= 0.05
+    assert provider.metrics["retries"] == 2
+    assert provider.metrics["throttled"] == 1
+    assert provider.breaker.state == "closed"
+
+
+def test_client_errors_do_not_trip_breaker():
+    provider = make_provider(lambda request: httpx.Response(404), failure_threshold=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(provider.get_json("https://example.test/"))
+    assert provider.breaker.state == "closed"
+    assert provider.metrics["failures"] == 0
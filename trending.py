@@ -0,0 +1,120 @@
+import logging
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COLLECTION = "apewisdom_leaderboard"
+NUMERIC_FIELDS = ["rank", "rank_24h_ago", "mentions", "mentions_24h_ago", "upvotes"]
+SCORES = ["mention_growth", "rank_velocity", "upvote_ratio", "composite"]
+# Weights of each z-scored signal in the composite momentum score
+COMPOSITE_WEIGHTS = {"mention_growth": 0.5, "rank_velocity": 0.3, "upvote_ratio": 0.2}
+
+
+def _num(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def snapshot_from_leaderboard(leaderboard: dict):
+    """
+    Columnar document for one leaderboard walk: one array per field, aligned
+    by position, so it loads straight into numpy.
+    """
+    items = list(leaderboard.values())
+    snapshot = {"timestamp": datetime.utcnow(), "tickers": [item.get("ticker") for item in items]}
+    for field in NUMERIC_FIELDS:
+        snapshot[field] = [_num(item.get(field)) for item in items]
+    return snapshot
+
+
+async def save_snapshot(db, leaderboard: dict):
+    snapshot = snapshot_from_leaderboard(leaderboard)
+    await db[SNAPSHOT_COLLECTION].insert_one(snapshot)
+    logger.info(f"Stored leaderboard snapshot with {len(snapshot['tickers'])} tickers")
+    return snapshot
+
+
+async def latest_scores(db):
+    """
+    Scores of the latest snapshot as {"snapshot_id", "timestamp", "scored"},
+    or None before the first ETL run. Only the snapshot's _id is read
+    unless it is newer than the cached scores.
+    """
+    head = await db[SNAPSHOT_COLLECTION].find_one({}, {"_id": 1, "timestamp": 1}, sort=[("timestamp", -1)])
+    if head is None:
+        return None
+    if _cache["snapshot_id"] != head["_id"]:
+        snapshot = await db[SNAPSHOT_COLLECTION].find_one({"_id": head["_id"]})
+        _cache.update(snapshot_id=head["_id"], timestamp=snapshot["timestamp"], scored=score_snapshot(snapshot))
+    return _cache
+
+
+# Scores of the latest snapshot, reused until a newer snapshot appears
+_cache = {"snapshot_id": None, "timestamp": None, "scored": None}
+
+
+def _zscore(values: np.ndarray):
+    std = np.nanstd(values)
+    if not np.isfinite(std) or std == 0:
+        return np.zeros_like(values)
+    return np.nan_to_num((values - np.nanmean(values)) / std)
+
+
+def score_snapshot(snapshot: dict):
+    """
+    Momentum scores for every ticker in one vectorized pass.
+    - mention_growth: relative change in mentions over 24h
+    - rank_velocity: places climbed over 24h, relative to the old rank
+    - upvote_ratio: upvotes per mention
+    - composite: weighted sum of the z-scored signals
+    Missing inputs give NaN for that signal and 0 in the composite.
+    """
+    columns = {field: np.asarray(snapshot[field], dtype=np.float64) for field in NUMERIC_FIELDS}
+    mentions = columns["mentions"]
+    mentions_ago = columns["mentions_24h_ago"]
+    rank = columns["rank"]
+    rank_ago = columns["rank_24h_ago"]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        scores = {
+            "mention_growth": (mentions - mentions_ago) / np.maximum(mentions_ago, 1.0),
+            "rank_velocity": (rank_ago - rank) / np.maximum(rank_ago, 1.0),
+            "upvote_ratio": columns["upvotes"] / np.maximum(mentions, 1.0),
+        }
+    scores["composite"] = sum(weight * _zscore(scores[name]) for name, weight in COMPOSITE_WEIGHTS.items())
+    return np.asarray(snapshot["tickers"], dtype=object), columns, scores
+
+
+def top_movers(scored: tuple, k: int = 20, by: str = "composite", min_mentions: float = 0):
+    """
+    The k tickers with the highest `by` score, best first, from the
+    output of score_snapshot().
+    """
+    tickers, columns, scores = scored
+
+    ranking = np.where(columns["mentions"] >= min_mentions, scores[by], np.nan)
+    ranking = np.nan_to_num(ranking, nan=-np.inf)
+    eligible = int(np.isfinite(ranking).sum())
+    k = min(k, eligible)
+    if k == 0:
+        return []
+
+    # O(n) selection of the top k, then sort only those
+    top = np.argpartition(-ranking, k - 1)[:k]
+    top = top[np.argsort(-ranking[top])]
+
+    return [
+        {
+            "ticker": tickers[i],
+            "rank": columns["rank"][i],
+            "rank_24h_ago": columns["rank_24h_ago"][i],
+            "mentions": columns["mentions"][i],
+            "mentions_24h_ago": columns["mentions_24h_ago"][i],
+            "upvotes": columns["upvotes"][i],
+            **{name: scores[name][i] for name in SCORES},
+        }
+        for i in top
+    ]
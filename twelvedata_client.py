@@ -1,16 +1,12 @@
-import requests
-from tenacity import retry, stop_after_attempt, wait_exponential
 import pandas as pd
+import upstream
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=2, max=10))
-
-def fetch_api(url, params=None, headers=None):
-
-    response = requests.get(url, params=params, headers=headers, timeout=10)
-    if response.status_code == 429:
-        raise Exception("Rate limit exceeded")
-    response.raise_for_status()
-    return response.json()
+async def fetch_api(url, params=None, headers=None):
+    """
+    Rate-limited, retried and circuit-broken call through the shared
+    upstream layer; never blocks the event loop.
+    """
+    return await upstream.twelvedata.get_json(url, params=params, headers=headers)
 
 def normalize_twelvedata(data):
     
@@ -1,6 +1,13 @@
 import os
+import asyncio
 from dotenv import load_dotenv
 from database import get_db
+import etl_lock
+import events
+import watchlist
+import columnar_store
+from indexes import ensure_collection_indexes
+from rollups import rollup_prices
 import twelvedata_client
 from datetime import datetime
 import logging
@@ -13,64 +20,80 @@ logger = logging.getLogger("twelvedata_etl")
 TWELVE_DATA_KEY = os.getenv("TWELVEDATA_KEY")
 TWELVE_DATA_URL = "https://api.twelvedata.com/time_series"
 
-SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "META", "INTC", "NVDA", "ORCL"]
+async def load_symbol(db, symbol, interval="1day", outputsize=30):
+    logger.info(f"Fetching data for {symbol} from TwelveData...")
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "outputsize": outputsize,
+        "apikey": TWELVE_DATA_KEY
+    }
+
+    try:
+        raw_data = await twelvedata_client.fetch_api(TWELVE_DATA_URL, params=params)
+        df = twelvedata_client.normalize_twelvedata(raw_data)
+        data = df.to_dict(orient="records")
+        if not data:
+            logger.warning(f"No data returned for {symbol}")
+            return None
+
+        await db[f"td_prices_{symbol}"].insert_many(data)
+        await ensure_collection_indexes(db, f"td_prices_{symbol}")
+        await rollup_prices(db, symbol, since=min(row["datetime"] for row in data))
+        await columnar_store.mark_changed(db, symbol, "prices")
+        await columnar_store.refresh(db, symbol, "prices")
+
+        logger.info(f"Inserted data for {symbol} into collection td_prices_{symbol}")
+
+        await db["td_logs"].insert_one({
+            "timestamp": datetime.now(),
+            "message": f"{symbol} processed ({len(data)} records inserted)"
+        })
+        return data
+
+    except Exception as exc:
+        logger.error(f"Error {symbol}: {exc}")
+        return None
 
 async def run_etl(interval="1day", outputsize=30):
     db = await get_db()
-    all_data = {}
-
-    for symbol in SYMBOLS:
-        logger.info(f"Fetching data for {symbol} from TwelveData...")
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "outputsize": outputsize,
-            "apikey": TWELVE_DATA_KEY
-        }
-
-        try:
-            raw_data = twelvedata_client.fetch_api(TWELVE_DATA_URL, params=params)
-            df = twelvedata_client.normalize_twelvedata(raw_data)
-            data = df.to_dict(orient="records")
-
-            await db[f"td_prices_{symbol}"].insert_many(data)
-
-            logger.info(f"Inserted data for {symbol} into collection td_prices_{symbol}")
-
-            all_data[symbol] = data
-
-            await db["td_logs"].insert_one({
-                "timestamp": datetime.now(),
-                "message": f"{symbol} processed ({len(data)} records inserted)"
-            })
-
-        except Exception as exc:
-            logger.error(f"Error {symbol}: {exc}")
+    symbols = await watchlist.get_symbols(db)
+
+    async def progress(number, total, batch, batch_results):
+        await db["td_logs"].insert_one({
+            "timestamp": datetime.now(),
+            "message": f"Batch {number}/{total} done ({len(batch_results)}/{len(batch)} symbols loaded)"
+        })
+
+    async with etl_lock.lease(db, "twelvedata") as held:
+        all_data = await watchlist.run_batched(
+            symbols,
+            lambda symbol: load_symbol(db, symbol, interval, outputsize),
+            progress=progress,
+            should_stop=lambda: held.lost
+        )
 
+    await events.etl_completed("twelvedata", all_data)
     return all_data
 
-async def get_last_results():
+async def get_last_results(page: int = 1, page_size: int = 50):
     db = await get_db()
-    results = {}
-
-    for symbol in SYMBOLS:
-        collection = db[f"td_prices_{symbol}"]
+    total, symbols = await watchlist.page_symbols(page, page_size, db=db)
 
-        last_records = (
-            await collection
+    async def last_records(symbol):
+        return await (
+            db[f"td_prices_{symbol}"]
             .find()
             .sort("_id", -1)
             .limit(30)
             .to_list(length=30)
         )
 
-        # Convertir ObjectId -> string
-        for record in last_records:
-            record["_id"] = str(record["_id"])
+    # One query per symbol on the page, issued concurrently
+    records = await asyncio.gather(*(last_records(symbol) for symbol in symbols))
+    results = dict(zip(symbols, records))
 
-        results[symbol] = last_records
-
-    return results
+    return {"total": total, "page": page, "page_size": page_size, "results": results}
 
 async def get_history():
     db = await get_db()
@@ -82,8 +105,4 @@ async def get_history():
         .to_list(length=200)
     )
 
-    for entry in history:
-        entry["_id"] = str(entry["_id"])
-        entry["timestamp"] = entry["timestamp"].isoformat()
-
     return history
\ No newline at end of file
@@ -0,0 +1,264 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """
+    The provider could not be reached or kept failing after all retries.
+    """
+
+
+class CircuitOpenError(UpstreamError):
+    """
+    The provider's circuit breaker is open: failing fast without a request.
+    """
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` requests per second on average, bursts of up
+    to `capacity`. A Retry-After from the provider pauses the bucket, so
+    every caller waits instead of hammering a throttled API.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, min(self.capacity, per_minute))
+        self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds: float):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        """
+        Wait for a token. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures;
+    open -> half_open after `reset_timeout` seconds, letting one probe through;
+    half_open -> closed on success, back to open on failure.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self):
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+            return True
+        return self.state == "closed"
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+def retry_after_seconds(response: httpx.Response):
+    """
+    Retry-After as seconds, whether sent as a delay or an HTTP date.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class Provider:
+    """
+    Everything needed to call one upstream API without stalling the app:
+    a shared async HTTP client, a token bucket, retries with full jitter
+    and a circuit breaker, plus counters for /upstream/metrics.
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, burst: float = None,
+                 max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 8.0,
+                 timeout: float = 10.0, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 throttle_pause: float = 60.0, is_throttled=None):
+        self.name = name
+        self.bucket = TokenBucket(requests_per_minute / 60.0, burst or max(1.0, requests_per_minute))
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        # Pause used when a throttle response carries no Retry-After
+        self.throttle_pause = throttle_pause
+        # Some APIs signal throttling in a 200 body rather than with a 429
+        self.is_throttled = is_throttled
+        self._client = None
+        self.metrics = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "throttle_wait_s": 0.0,
+            "short_circuited": 0,
+        }
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int):
+        # Full jitter: spreads retries of concurrent callers apart
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _throttled(self, response: httpx.Response):
+        self.metrics["throttled"] += 1
+        pause = retry_after_seconds(response)
+        self.bucket.pause(pause if pause is not None else self.throttle_pause)
+        logger.warning(f"{self.name} throttled us; pausing {pause if pause is not None else self.throttle_pause:.1f}s")
+
+    async def get_json(self, url: str, params: dict = None, headers: dict = None):
+        if not self.breaker.allow():
+            self.metrics["short_circuited"] += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+        try:
+            payload = await self._get_with_retries(url, params, headers)
+        except httpx.HTTPStatusError:
+            # 4xx: our request is wrong, the provider itself is healthy
+            self.breaker.record_success()
+            raise
+        except asyncio.CancelledError:
+            self.breaker.probe_in_flight = False
+            raise
+        except Exception:
+            self.metrics["failures"] += 1
+            self.breaker.record_failure()
+            raise
+
+        self.metrics["successes"] += 1
+        self.breaker.record_success()
+        return payload
+
+    async def _get_with_retries(self, url, params, headers):
+        last_error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.metrics["retries"] += 1
+                await asyncio.sleep(self._backoff(attempt))
+            self.metrics["throttle_wait_s"] += await self.bucket.acquire()
+            self.metrics["requests"] += 1
+            try:
+                response = await self.client.get(url, params=params, headers=headers)
+            except httpx.TransportError as exc:
+                last_error = exc
+                continue
+
+            if response.status_code == 429:
+                self._throttled(response)
+                last_error = "rate limit exceeded"
+                continue
+            if response.status_code >= 500:
+                last_error = f"HTTP {response.status_code}"
+                continue
+            response.raise_for_status()
+
+            payload = response.json()
+            if self.is_throttled is not None and self.is_throttled(payload):
+                self._throttled(response)
+                last_error = "rate limit exceeded"
+                continue
+            return payload
+
+        raise UpstreamError(f"{self.name} failed after {self.max_attempts} attempts: {last_error}")
+
+    def snapshot(self):
+        return {
+            **self.metrics,
+            "throttle_wait_s": round(self.metrics["throttle_wait_s"], 3),
+            "breaker_state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "tokens_available": round(self.bucket.tokens, 2),
+            "paused_for_s": round(max(0.0, self.bucket.blocked_until - time.monotonic()), 3),
+        }
+
+
+# --- PROVIDERS ---
+twelvedata = Provider(
+    "twelvedata",
+    requests_per_minute=float(os.getenv("TWELVEDATA_REQUESTS_PER_MINUTE", "8")),
+    # TwelveData reports exhausted credits as HTTP 200 with {"code": 429}
+    is_throttled=lambda payload: isinstance(payload, dict) and payload.get("code") == 429,
+)
+apewisdom = Provider(
+    "apewisdom",
+    requests_per_minute=float(os.getenv("APEWISDOM_REQUESTS_PER_MINUTE", "60")),
+)
+PROVIDERS = [twelvedata, apewisdom]
+
+
+def metrics():
+    return {provider.name: provider.snapshot() for provider in PROVIDERS}
+
+
+async def close():
+    for provider in PROVIDERS:
+        await provider.close()
@@ -0,0 +1,138 @@
+import os
+import re
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# --- CONFIGURATION ---
+WATCHLIST_COLLECTION = "watchlist"
+# Seeded into an empty watchlist so a fresh install behaves like before.
+DEFAULT_SYMBOLS = ["AAPL", "MSFT", "GOOGL", "AMZN", "META", "INTC", "NVDA", "ORCL"]
+# ETL runs process the universe in batches of this many symbols...
+ETL_BATCH_SIZE = int(os.getenv("ETL_BATCH_SIZE", "50"))
+# ...with at most this many symbols in flight at once.
+ETL_CONCURRENCY = int(os.getenv("ETL_CONCURRENCY", "4"))
+
+# Same alphabet the per-symbol collection names are indexed with
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9.\-]{1,12}$")
+
+
+def normalize_symbol(symbol: str):
+    """
+    Upper-cased symbol, or None if it cannot be used as a collection suffix.
+    """
+    symbol = symbol.strip().upper()
+    return symbol if SYMBOL_PATTERN.match(symbol) else None
+
+
+async def _seed_if_empty(db):
+    if await db[WATCHLIST_COLLECTION].estimated_document_count() == 0:
+        await _upsert(db, DEFAULT_SYMBOLS)
+
+
+async def _upsert(db, symbols: list[str]):
+    now = datetime.utcnow()
+    requests = [
+        UpdateOne(
+            {"_id": symbol},
+            {"$set": {"active": True, "updated_at": now}, "$setOnInsert": {"added_at": now}},
+            upsert=True
+        )
+        for symbol in dict.fromkeys(symbols)
+    ]
+    if requests:
+        await db[WATCHLIST_COLLECTION].bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+async def get_symbols(db=None):
+    """
+    Every active symbol, sorted.
+    """
+    db = db if db is not None else await get_db()
+    await _seed_if_empty(db)
+    cursor = db[WATCHLIST_COLLECTION].find({"active": True}, {"_id": 1}).sort("_id", 1)
+    return [doc["_id"] async for doc in cursor]
+
+
+async def page_symbols(page: int = 1, page_size: int = 50, db=None):
+    """
+    One page of active symbols and the total count.
+    """
+    db = db if db is not None else await get_db()
+    await _seed_if_empty(db)
+    query = {"active": True}
+    total = await db[WATCHLIST_COLLECTION].count_documents(query)
+    cursor = (
+        db[WATCHLIST_COLLECTION]
+        .find(query, {"_id": 1})
+        .sort("_id", 1)
+        .skip((page - 1) * page_size)
+        .limit(page_size)
+    )
+    return total, [doc["_id"] async for doc in cursor]
+
+
+async def add_symbols(symbols: list[str], db=None):
+    """
+    Add (or re-activate) symbols in one unordered bulk upsert.
+    Returns the number of symbols written.
+    """
+    db = db if db is not None else await get_db()
+    await _seed_if_empty(db)
+    written = await _upsert(db, symbols)
+    logger.info(f"Watchlist updated with {written} symbols")
+    return written
+
+
+async def remove_symbol(symbol: str, db=None):
+    """
+    Deactivate a symbol. Its stored history is kept.
+    """
+    db = db if db is not None else await get_db()
+    await _seed_if_empty(db)
+    result = await db[WATCHLIST_COLLECTION].update_one(
+        {"_id": symbol, "active": True},
+        {"$set": {"active": False, "updated_at": datetime.utcnow()}}
+    )
+    return result.modified_count == 1
+
+
+def batches(symbols: list[str], size: int = None):
+    size = size or ETL_BATCH_SIZE
+    for start in range(0, len(symbols), size):
+        yield symbols[start:start + size]
+
+
+async def run_batched(symbols: list[str], worker, progress=None, should_stop=None):
+    """
+    Run `worker(symbol)` over the universe batch by batch with bounded
+    concurrency. `progress(number, total, batch, batch_results)` is
+    awaited after each batch; `should_stop()` is checked before each one.
+    Returns {symbol: result} for every non-empty result.
+    """
+    semaphore = asyncio.Semaphore(ETL_CONCURRENCY)
+
+    async def bounded(symbol):
+        async with semaphore:
+            return symbol, await worker(symbol)
+
+    all_results = {}
+    chunks = list(batches(symbols))
+    for number, batch in enumerate(chunks, start=1):
+        if should_stop is not None and should_stop():
+            logger.error(f"Stopping before batch {number}/{len(chunks)}")
+            break
+        batch_results = {
+            symbol: result
+            for symbol, result in await asyncio.gather(*(bounded(symbol) for symbol in batch))
+            if result
+        }
+        all_results.update(batch_results)
+        if progress is not None:
+            await progress(number, len(chunks), batch, batch_results)
+    return all_results